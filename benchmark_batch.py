@@ -0,0 +1,159 @@
+# Measures how the throughput of a batch sweep scales with the number of worker
+# processes of BatchRunnerMP, to size the machines batch runs are sent to.
+# To run from the terminal, type:
+# $ python benchmark_batch.py
+# It runs the same pipeline as the batch in model.py: AggregatingBatchRunner
+# with StepStatistics, StepDataWriter when RAW_STEP_DATA is set, the
+# BATCH_REPORT_INTERVAL reporting cadence, and the same merge afterwards.
+# Options (python benchmark_batch.py --help): --max-workers (default: number of
+# CPUs), --iterations and --steps set the size of the sweep, --format the raw
+# step data format, --output saves the results as JSON.
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import dill
+
+import model as md
+
+# fixed-size sweep, run once for every number of workers
+SWEEP_PARAMS = {"num_agents": [1000],
+                "infectious_seed_pc": [0.01, 0.05],
+                "recovered_seed_pc": [0.1],
+                "high_risk_pc": [0.25],
+                "grid_area": ["Small"],
+                "house_init": ["Neighborhood"],
+                "release_strat": ["Everyone release", "Low risk houses"],
+                "mobility_speed": ["high"],
+                "weeks_to_second_release": [2]}
+
+
+class TimedVirus(md.Virus):
+    '''
+    Virus that remembers the CPU time of its process when it is built, so the
+    CPU time of each run can be reported back from the worker
+    '''
+    def __init__(self, **kwargs):
+        self.cpu_start = time.process_time()
+        super().__init__(**kwargs)
+
+
+def run_cpu_seconds(model):
+    return time.process_time() - model.cpu_start
+
+
+class MeasuredBatchRunner(md.AggregatingBatchRunner):
+    '''
+    AggregatingBatchRunner that counts the bytes of the results the workers
+    send back, before the step series are folded into the statistics
+    '''
+    def __init__(self, model_cls, statistics, **kwargs):
+        super().__init__(model_cls, statistics, **kwargs)
+        self.result_bytes = 0
+
+    def store_run(self, model_vars, agent_vars):
+        self.result_bytes += len(dill.dumps((model_vars, agent_vars)))
+        super().store_run(model_vars, agent_vars)
+
+
+def merge_outputs(runner, directory, file_format):
+    '''
+    Same post-processing as the __main__ block of model.py, writing into directory
+    '''
+    br_df = runner.get_model_vars_dataframe()
+    runner.statistics.table().to_csv(os.path.join(directory, "summary.csv"), index=False)
+    if md.RAW_STEP_DATA:
+        manifests = list(br_df["Step Data"])
+        if file_format == "parquet":
+            md.merge_parquet_step_files(manifests, os.path.join(directory, "steps.parquet"),
+                                        os.path.join(directory, "runs.parquet"))
+        else:
+            step_files = sorted(set(manifest["path"] for manifest in manifests))
+            md.merge_step_files(step_files, os.path.join(directory, "steps.csv"))
+
+
+def benchmark_workers(workers, iterations, steps, file_format):
+    '''
+    Runs the sweep with the given number of workers, returns its throughput,
+    CPU utilization, bytes sent between processes and post-processing time
+    '''
+    directory = tempfile.mkdtemp(prefix="benchmark_batch_")
+    reporters = {"Step Series": md.track_step_series,
+                 "CPU Seconds": run_cpu_seconds}
+    if md.RAW_STEP_DATA:
+        reporters["Step Data"] = md.StepDataWriter(os.path.join(directory, "runs"), file_format)
+    runner = MeasuredBatchRunner(TimedVirus,
+                                 md.StepStatistics(),
+                                 nr_processes=workers,
+                                 variable_parameters=SWEEP_PARAMS,
+                                 fixed_parameters={"report_interval": md.BATCH_REPORT_INTERVAL},
+                                 iterations=iterations,
+                                 max_steps=steps,
+                                 model_reporters=reporters,
+                                 display_progress=False)
+    # every task sends the pickled runner to a worker (see BatchRunnerMP.run_all)
+    task_bytes = len(dill.dumps(runner))
+
+    parent_cpu_start = time.process_time()
+    start = time.perf_counter()
+    runner.run_all()
+    wall_seconds = time.perf_counter() - start
+    parent_cpu_seconds = time.process_time() - parent_cpu_start
+
+    runs = len(runner.model_vars)
+    worker_cpu_seconds = sum(run["CPU Seconds"] for run in runner.model_vars.values())
+
+    start = time.perf_counter()
+    merge_outputs(runner, directory, file_format)
+    post_seconds = time.perf_counter() - start
+    shutil.rmtree(directory)
+
+    runner.pool.close()
+    runner.pool.join()
+    runner.pool.clear()
+
+    return {"workers": workers,
+            "runs": runs,
+            "wall_seconds": wall_seconds,
+            "runs_per_hour": runs/wall_seconds*3600,
+            # share of the workers' CPU time spent inside model runs
+            "worker_cpu_utilization": worker_cpu_seconds/(wall_seconds*workers),
+            "parent_cpu_seconds": parent_cpu_seconds,
+            "ipc_bytes_to_workers": task_bytes*runs,
+            "ipc_bytes_from_workers": runner.result_bytes,
+            "post_processing_seconds": post_seconds}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark batch throughput against worker count.")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count())
+    parser.add_argument("--iterations", type=int, default=4,
+                        help="runs of each parameter combination")
+    parser.add_argument("--steps", type=int, default=600, help="steps per run")
+    parser.add_argument("--format", default=md.OUTPUT_FORMAT, choices=["csv", "parquet"],
+                        help="format of the raw step data (if model.RAW_STEP_DATA)")
+    parser.add_argument("--output", default=None, help="JSON file for the results")
+    args = parser.parse_args()
+
+    print("{:>7s} {:>5s} {:>10s} {:>10s} {:>9s} {:>12s} {:>12s} {:>12s} {:>10s}".format(
+        "workers", "runs", "wall s", "runs/hour", "CPU use", "parent CPU s",
+        "MB to work.", "MB from w.", "post s"))
+    results = []
+    for workers in range(1, args.max_workers + 1):
+        result = benchmark_workers(workers, args.iterations, args.steps, args.format)
+        results.append(result)
+        print("{workers:7d} {runs:5d} {wall_seconds:10.1f} {runs_per_hour:10.0f} "
+              "{worker_cpu_utilization:9.0%} {parent_cpu_seconds:12.2f} {to_mb:12.2f} "
+              "{from_mb:12.2f} {post_processing_seconds:10.2f}".format(
+                  to_mb=result["ipc_bytes_to_workers"]/1e6,
+                  from_mb=result["ipc_bytes_from_workers"]/1e6, **result))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"sweep": SWEEP_PARAMS, "iterations": args.iterations,
+                       "steps": args.steps, "format": args.format,
+                       "report_interval": md.BATCH_REPORT_INTERVAL,
+                       "raw_step_data": md.RAW_STEP_DATA, "results": results}, f, indent=1)
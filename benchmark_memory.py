@@ -0,0 +1,70 @@
+# Reports the memory used per agent by the model's agent classes.
+# To run from the terminal, type:
+# $ python benchmark_memory.py [number of agents]
+import sys
+import tracemalloc
+from mesa import Agent
+import model as md
+
+
+class DictVirusModelAgent(Agent):
+    '''
+    Layout of VirusModelAgent before the slot-based agent classes: a mesa
+    Agent with a per-instance __dict__ and the same attributes.
+    '''
+    def __init__(self, pos, model, agent_compartment, risk_group, unique_id):
+        super().__init__(unique_id, model)
+        self.pos = pos
+        self.compartment = agent_compartment
+        self.risk_group = risk_group
+        self.infection_timeline = 0
+        self.at_home = True
+
+
+class DictHouseAgent(Agent):
+    '''
+    Layout of HouseAgent before the slot-based agent classes.
+    '''
+    def __init__(self, pos, model, unique_id, high_risk_house):
+        super().__init__(unique_id, model)
+        self.pos = pos
+        self.compartment = "house"
+        self.people_home = True
+        self.high_risk = high_risk_house
+
+
+def bytes_per_agent(make_agent, num_agents):
+    '''
+    Average number of bytes allocated for each agent built by make_agent(i)
+    '''
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    agents = [make_agent(i) for i in range(num_agents)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # do not count the list holding the agents
+    return (after - before - sys.getsizeof(agents)) / num_agents
+
+
+if __name__ == '__main__':
+    num_agents = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    model = md.Virus(num_agents=100)
+
+    people = [("VirusModelAgent (before, __dict__)",
+               lambda i: DictVirusModelAgent((i % 20, i % 17), model, "susceptible", "low", i)),
+              ("VirusModelAgent (after, __slots__)",
+               lambda i: md.VirusModelAgent((i % 20, i % 17), model, md.SUSCEPTIBLE, md.LOW_RISK, i))]
+    houses = [("HouseAgent (before, __dict__)",
+               lambda i: DictHouseAgent((i % 20, i % 17), model, i, False)),
+              ("HouseAgent (after, __slots__)",
+               lambda i: md.HouseAgent((i % 20, i % 17), model, i, False))]
+
+    print("Bytes per agent, {} agents".format(num_agents))
+    for name, make_agent in people + houses:
+        print("{:40s} {:8.1f}".format(name, bytes_per_agent(make_agent, num_agents)))
+
+    array_model = md.Virus(num_agents=1000, engine="array")
+    engine = array_model.array_engine
+    array_bytes = sum(getattr(engine, field).nbytes for field in
+                      ("x", "y", "compartment", "high_risk", "infection_timeline", "at_home"))
+    print("{:40s} {:8.1f}".format("ArrayEngine (per person)", array_bytes / 1000))
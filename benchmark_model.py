@@ -0,0 +1,229 @@
+# Benchmarks building and stepping the Virus model with fixed seeds.
+# To run from the terminal, type:
+# $ python benchmark_model.py
+# Options (python benchmark_model.py --help): --full runs every combination of
+# grid area, number of agents, release strategy, house layout and mobility
+# instead of varying one at a time, --output sets the results file, and
+# --save-baseline stores the results as the baseline later runs are checked
+# against. The run fails (exit status 1) if a case is slower or uses more
+# memory than the baseline by more than --tolerance.
+import argparse
+import itertools
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import mesa
+import numpy as np
+
+import model as md
+
+GRID_AREAS = ["Demo", "Small", "Large"]
+NUM_AGENTS = [100, 1000, 5000]
+RELEASE_STRATEGIES = ["Random individual houses", "Random group of houses",
+                      "Low risk individuals", "Low risk houses", "Everyone release"]
+HOUSE_INITS = ["Random", "Neighborhood", "Clusters"]
+MOBILITY_SPEEDS = ["low", "high"]
+
+# case every dimension is varied from in the default (one at a time) matrix
+BASE_CASE = {"grid_area": "Small",
+             "num_agents": 1000,
+             "release_strat": "Everyone release",
+             "house_init": "Random",
+             "mobility_speed": "low"}
+
+DIMENSIONS = {"grid_area": GRID_AREAS,
+              "num_agents": NUM_AGENTS,
+              "release_strat": RELEASE_STRATEGIES,
+              "house_init": HOUSE_INITS,
+              "mobility_speed": MOBILITY_SPEEDS}
+
+# results checked against the baseline, and whether higher is better
+METRICS = {"ticks_per_second": True,
+           "agent_steps_per_second": True,
+           "init_seconds": False,
+           "peak_memory_bytes": False}
+
+# smallest change of a metric counted as a regression, below it is timer noise
+NOISE_FLOORS = {"init_seconds": 0.05}
+# smallest relative tolerance of a metric, whatever --tolerance is: on a
+# shared machine the step time of identical seeded runs drifts by up to 50%
+# over minutes, and even the best of REPEATS moved by 40% between two runs of
+# the benchmark on unchanged code. Lower these on a quiet machine.
+MIN_TOLERANCES = {"ticks_per_second": 0.5,
+                  "agent_steps_per_second": 0.5}
+
+SEED = 2020
+# rounds over all cases, each builds and runs every case once and the best
+# time of each case is kept. Interleaving the rounds keeps a slow spell of the
+# machine from hitting every repeat of one case.
+REPEATS = 5
+BASELINE_FILE = "benchmark_baseline.json"
+
+
+def benchmark_cases(full):
+    '''
+    List of the parameter dicts to benchmark: every combination of DIMENSIONS
+    if full, otherwise BASE_CASE and every value of each dimension on its own
+    '''
+    if full:
+        return [dict(zip(DIMENSIONS, values)) for values in itertools.product(*DIMENSIONS.values())]
+    cases = [dict(BASE_CASE)]
+    for dimension, values in DIMENSIONS.items():
+        for value in values:
+            case = dict(BASE_CASE, **{dimension: value})
+            if case not in cases:
+                cases.append(case)
+    return cases
+
+
+def case_key(case):
+    '''
+    Identifies a case across result files
+    '''
+    return json.dumps({name: case[name] for name in sorted(case)})
+
+
+def time_case(case, steps, engine):
+    '''
+    Builds and steps a model with the fixed seed, so every run of a case does
+    the same work, returns the build and step times in seconds
+    '''
+    start = time.perf_counter()
+    model = md.Virus(seed=SEED, engine=engine, **case)
+    init_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(steps):
+        model.step()
+    return init_seconds, time.perf_counter() - start
+
+
+def peak_memory(case, steps, engine):
+    '''
+    Peak memory of building and stepping a model, measured on a shorter run
+    because tracemalloc slows the model down
+    '''
+    tracemalloc.start()
+    model = md.Virus(seed=SEED, engine=engine, **case)
+    for _ in range(min(steps, 10)):
+        model.step()
+    peak_memory_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak_memory_bytes
+
+
+def run_cases(cases, steps, engine):
+    '''
+    Benchmarks every case, returns its timings (best of REPEATS rounds) and
+    peak memory, or the error that kept it from being built
+    '''
+    best = {}
+    errors = {}
+    for _ in range(REPEATS):
+        for case in cases:
+            key = case_key(case)
+            if key in errors:
+                continue
+            try:
+                times = time_case(case, steps, engine)
+            except ValueError as error: # e.g. too many houses to fit on the grid
+                errors[key] = str(error)
+                continue
+            best[key] = tuple(map(min, zip(best.get(key, times), times)))
+    results = []
+    for case in cases:
+        key = case_key(case)
+        if key in errors:
+            results.append({"case": case, "error": errors[key]})
+            continue
+        init_seconds, step_seconds = best[key]
+        results.append({"case": case,
+                        "init_seconds": init_seconds,
+                        "ticks_per_second": steps/step_seconds,
+                        "agent_steps_per_second": steps*case["num_agents"]/step_seconds,
+                        "peak_memory_bytes": peak_memory(case, steps, engine)})
+    return results
+
+
+def regressions(results, baseline, tolerance):
+    '''
+    List of messages for the metrics of results that are worse than in
+    baseline by more than tolerance (a fraction, at least MIN_TOLERANCES)
+    '''
+    baseline_cases = {case_key(result["case"]): result for result in baseline["results"]}
+    messages = []
+    for result in results["results"]:
+        old = baseline_cases.get(case_key(result["case"]))
+        if old is None or "error" in result or "error" in old:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            if abs(result[metric] - old[metric]) < NOISE_FLOORS.get(metric, 0):
+                continue
+            ratio = result[metric]/old[metric]
+            allowed = max(tolerance, MIN_TOLERANCES.get(metric, 0))
+            if (ratio < 1 - allowed) if higher_is_better else (ratio > 1 + allowed):
+                messages.append("{}: {} {:.4g} vs baseline {:.4g} ({:+.0%})".format(
+                    case_key(result["case"]), metric, result[metric], old[metric], ratio - 1))
+    return messages
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the Virus model.")
+    parser.add_argument("--full", action="store_true",
+                        help="run every combination of the benchmark dimensions")
+    parser.add_argument("--steps", type=int, default=100, help="steps per run")
+    parser.add_argument("--engine", default="object", choices=["object", "array"])
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store the results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed relative regression before failing")
+    args = parser.parse_args()
+
+    results = {"meta": {"python": platform.python_version(),
+                        "numpy": np.__version__,
+                        "mesa": mesa.__version__,
+                        "machine": platform.platform(),
+                        "engine": args.engine,
+                        "steps": args.steps,
+                        "seed": SEED},
+               "results": run_cases(benchmark_cases(args.full), args.steps, args.engine)}
+    print("{:70s} {:>10s} {:>14s} {:>10s} {:>10s}".format(
+        "case", "ticks/s", "agent-steps/s", "init s", "peak MB"))
+    for result in results["results"]:
+        case = result["case"]
+        if "error" in result:
+            print("{:70s} skipped: {}".format(case_key(case), result["error"]))
+            continue
+        print("{:70s} {:10.1f} {:14.0f} {:10.3f} {:10.1f}".format(
+            ", ".join(str(value) for value in case.values()), result["ticks_per_second"],
+            result["agent_steps_per_second"], result["init_seconds"],
+            result["peak_memory_bytes"]/1e6))
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=1)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=1)
+        print("Saved baseline to {}".format(args.baseline))
+        sys.exit(0)
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print("No baseline at {}, run with --save-baseline to store one".format(args.baseline))
+        sys.exit(0)
+    if baseline["meta"]["engine"] != args.engine or baseline["meta"]["steps"] != args.steps:
+        print("Baseline was run with engine={engine}, steps={steps}, not compared".format(**baseline["meta"]))
+        sys.exit(0)
+    failures = regressions(results, baseline, args.tolerance)
+    if failures:
+        print("PERFORMANCE REGRESSION against {}:".format(args.baseline))
+        for message in failures:
+            print("  " + message)
+        sys.exit(1)
+    print("No regression against {} (tolerance {:.0%})".format(args.baseline, args.tolerance))
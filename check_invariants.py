@@ -0,0 +1,132 @@
+'''
+Consistency checks of the Virus model across its schedulers and engines.
+
+1. After a run in every scheduler/engine mode, the bookkeeping the model
+   keeps up to date incrementally (compartment_counts and the symptomatic/
+   asymptomatic grids) must equal a recount from the people.
+2. ActiveSetActivation only skips agents that cannot change state, so over
+   many seeds its final counts must match RandomActivation's within sampling
+   error.
+
+Exits with status 1 if a check fails.
+
+Usage:
+$ python check_invariants.py [number of seeds for check 2]
+'''
+import sys
+
+import numpy as np
+
+import model as md
+
+# scheduler/engine modes of check 1
+MODES = [{"engine": "object", "scheduler": "random"},
+         {"engine": "object", "scheduler": "active"},
+         {"engine": "object", "update": "synchronous"},
+         {"engine": "object", "scheduler": "random", "profile": True},
+         {"engine": "array"},
+         {"engine": "array", "substeps": 4, "infection_substeps": [0, 2]},
+         {"engine": "array", "time_step": "day"}]
+
+# settings every mode is run with
+SETTINGS = [{"mobility_speed": "low", "release_strat": "Everyone release", "house_init": "Random"},
+            {"mobility_speed": "high", "release_strat": "Low risk houses", "house_init": "Neighborhood"},
+            {"mobility_speed": "low", "release_strat": "Random individual houses", "house_init": "Clusters"}]
+
+DAYS = 30
+
+# setting of check 2, an outbreak that does not reach everyone in DAYS days
+SCHEDULER_CHECK = {"num_agents": 1000, "grid_area": "Small", "mobility_speed": "low",
+                   "release_strat": "Everyone release", "house_init": "Neighborhood"}
+
+# check 2 fails if the mean final counts differ by more than this many standard errors
+MAX_Z = 4.0
+
+
+def recount(model):
+    '''
+    Compartment histogram and symptomatic/asymptomatic cell counts (with the
+    spare zero entry) counted from the people of the model
+    '''
+    if model.engine == "array":
+        engine = model.array_engine
+        compartment = engine.compartment
+        risk = engine.high_risk.astype(np.int64)
+        cells = model.topology.cell((engine.x, engine.y))
+    else:
+        compartment = np.array([person.state for person in model.people])
+        risk = np.array([person.risk for person in model.people])
+        cells = np.array([model.topology.cell(person.pos) for person in model.people])
+    counts = np.zeros_like(model.compartment_counts)
+    np.add.at(counts, (compartment, risk), 1)
+    grids = []
+    for code in (md.INFECTIOUS_SYMPTOMATIC, md.INFECTIOUS_ASYMPTOMATIC):
+        grids.append(np.bincount(cells[compartment == code], minlength=model.topology.num_cells + 1))
+    return counts, grids[0], grids[1]
+
+
+def check_bookkeeping(model):
+    '''
+    List of messages for the incremental counts of model that differ from a recount
+    '''
+    counts, symptomatic, asymptomatic = recount(model)
+    errors = []
+    if not np.array_equal(model.compartment_counts, counts):
+        errors.append("compartment_counts differ from the people")
+    if not np.array_equal(model.symptomatic_cells, symptomatic):
+        errors.append("symptomatic grid differs from the people")
+    if not np.array_equal(model.asymptomatic_cells, asymptomatic):
+        errors.append("asymptomatic grid differs from the people")
+    if model.engine == "object":
+        misplaced = sum(person not in model.grid.get_cell_list_contents([person.pos])
+                        for person in model.people)
+        if misplaced:
+            errors.append("{} people are not in the grid cell of their pos".format(misplaced))
+    return errors
+
+
+def final_counts(seed, **params):
+    model = md.Virus(seed=seed, max_days=DAYS, **params)
+    while model.running:
+        model.step()
+    return [model.susceptible_count, model.exposed_count, model.infectious_count,
+            model.recovered_count, model.dead_count]
+
+
+if __name__ == '__main__':
+    seeds = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    failures = []
+
+    print("1. incremental counts against a recount after {} days".format(DAYS))
+    for mode in MODES:
+        for setting in SETTINGS:
+            model = md.Virus(seed=1, num_agents=300, max_days=DAYS, **mode, **setting)
+            while model.running:
+                model.step()
+            errors = check_bookkeeping(model)
+            name = ", ".join("{}={}".format(key, value) for key, value in dict(mode, **setting).items())
+            print("{:100s} {}".format(name, "; ".join(errors) or "ok"))
+            failures += [name + ": " + error for error in errors]
+
+    print("2. final counts of ActiveSetActivation against RandomActivation, {} seeds".format(seeds))
+    print("compartment | random | active | z")
+    results = {scheduler: np.array([final_counts(seed, scheduler=scheduler, **SCHEDULER_CHECK)
+                                    for seed in range(seeds)])
+               for scheduler in ("random", "active")}
+    for column, name in enumerate(md.STEP_COLUMNS[1:]):
+        random_counts = results["random"][:, column]
+        active_counts = results["active"][:, column]
+        se = np.sqrt(random_counts.var(ddof=1)/seeds + active_counts.var(ddof=1)/seeds)
+        z = (active_counts.mean() - random_counts.mean())/se if se > 0 else 0.0
+        print("{} | {:.1f} ± {:.1f} | {:.1f} ± {:.1f} | {:+.2f}".format(
+            name, random_counts.mean(), random_counts.std(ddof=1)/np.sqrt(seeds),
+            active_counts.mean(), active_counts.std(ddof=1)/np.sqrt(seeds), z))
+        if abs(z) > MAX_Z:
+            failures.append("{}: active scheduler mean differs by {:.1f} standard errors".format(name, z))
+
+    if failures:
+        print("FAILED:")
+        for failure in failures:
+            print("  " + failure)
+        sys.exit(1)
+    print("All checks passed")
@@ -0,0 +1,61 @@
+'''
+Compares the day-resolution mode (time_step="day") of the array engine with
+the tick-level model on a few seeds, reporting epidemic summaries and run time.
+
+Usage:
+$ python compare_time_steps.py [number of agents] [number of seeds] [days]
+'''
+import sys
+import time
+
+import numpy as np
+
+from model import Virus
+
+# the first three reach nearly everyone, the last two are outbreaks that
+# stop short, where differences in contact counts show in the attack rate
+SETTINGS = [{"mobility_speed": "low", "release_strat": "Everyone release"},
+            {"mobility_speed": "high", "release_strat": "Everyone release"},
+            {"mobility_speed": "high", "release_strat": "Low risk houses"},
+            {"mobility_speed": "low", "release_strat": "Low risk houses"},
+            {"mobility_speed": "high", "release_strat": "Random individual houses"}]
+
+
+def summarize(model, ticks_per_day):
+    '''
+    Attack rate, peak infectious fraction, day of the peak and deaths of a finished run
+    '''
+    df = model.datacollector.get_model_vars_dataframe()
+    infectious = df["Infectious"].to_numpy()
+    peak = int(np.argmax(infectious))
+    return (1.0 - df["Susceptible"].iloc[-1]/model.num_agents,
+            infectious[peak]/model.num_agents,
+            df["Step"].iloc[peak]/ticks_per_day,
+            df["Dead"].iloc[-1])
+
+
+def run(time_step, seed, days, **params):
+    model = Virus(engine="array", time_step=time_step, seed=seed, **params)
+    start = time.perf_counter()
+    for _ in range(days*model.ticks_per_day):
+        model.step()
+    return summarize(model, model.ticks_per_day), time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    num_agents = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    seeds = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    days = int(sys.argv[3]) if len(sys.argv) > 3 else 120
+    print("mobility | release | time_step | attack rate | peak infectious | peak day | dead | seconds/run")
+    for setting in SETTINGS:
+        params = dict(setting, num_agents=num_agents, grid_area="Small",
+                      house_init="Neighborhood", infectious_seed_pc=0.01)
+        for time_step in ("tick", "day"):
+            results = [run(time_step, seed, days, **params) for seed in range(seeds)]
+            summaries = np.array([summary for summary, _ in results])
+            mean = summaries.mean(axis=0)
+            sd = summaries.std(axis=0)
+            seconds = np.mean([elapsed for _, elapsed in results])
+            print("{} | {} | {} | {:.3f} ± {:.3f} | {:.3f} ± {:.3f} | {:.1f} ± {:.1f} | {:.1f} ± {:.1f} | {:.3f}".format(
+                setting["mobility_speed"], setting["release_strat"], time_step,
+                mean[0], sd[0], mean[1], sd[1], mean[2], sd[2], mean[3], sd[3], seconds))
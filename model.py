@@ -1,7 +1,6 @@
 # to run with model, run, and server files, use terminal command $ mesa runserver
-import random
-from mesa import Model, Agent
-from mesa.time import RandomActivation
+from mesa import Model
+from mesa.time import BaseScheduler, RandomActivation
 from mesa.datacollection import DataCollector
 from mesa.space import MultiGrid
 import scipy.stats
@@ -13,6 +12,9 @@ import itertools
 import pandas as pd
 import os
 import time
+import functools
+from collections import defaultdict
+from tqdm import tqdm
 
 # Assumptions of model, from Joshua Weitz
 EXPOSED_PERIOD = 4 #days
@@ -36,33 +38,585 @@ GRID_HEIGHT_SMALL = 100
 GRID_WIDTH_SMALL = 100
 GRID_HEIGHT_LARGE = 250
 GRID_WIDTH_LARGE = 250
+# keys: named grid_area, value: (width, height)
+GRID_SIZES = {"Demo": (GRID_WIDTH_DEMO, GRID_HEIGHT_DEMO),
+              "Small": (GRID_WIDTH_SMALL, GRID_HEIGHT_SMALL),
+              "Large": (GRID_WIDTH_LARGE, GRID_HEIGHT_LARGE)}
+# smallest width and height of a grid, so the four Von Neumann neighbors of a
+# cell are distinct cells on the torus
+MIN_GRID_SIDE = 3
+# "Clusters" houses are placed in sixths of the grid, so it needs at least 6 cells each way
+MIN_CLUSTERS_GRID_SIDE = 6
 
-def checkKey(dict, key):
+# Integer codes for compartments
+# (bit flags, so INFECTIOUS_SYMPTOMATIC | INFECTIOUS_ASYMPTOMATIC = INFECTIOUS)
+SUSCEPTIBLE = 1
+EXPOSED = 2
+INFECTIOUS_SYMPTOMATIC = 4
+INFECTIOUS_ASYMPTOMATIC = 8
+RECOVERED = 16
+DEAD = 32
+INFECTIOUS = INFECTIOUS_SYMPTOMATIC | INFECTIOUS_ASYMPTOMATIC
+COMPARTMENT_CODES = {"susceptible": SUSCEPTIBLE,
+                     "exposed": EXPOSED,
+                     "infectious_symptomatic": INFECTIOUS_SYMPTOMATIC,
+                     "infectious_asymptomatic": INFECTIOUS_ASYMPTOMATIC,
+                     "recovered": RECOVERED,
+                     "dead": DEAD}
+COMPARTMENT_NAMES = {code: name for name, code in COMPARTMENT_CODES.items()}
 
-    if key in dict.keys():
-        val = "Present"
-    else:
-        val = "Not present"
+# Integer codes for risk groups
+LOW_RISK = 0
+HIGH_RISK = 1
+RISK_GROUP_CODES = {"low": LOW_RISK, "high": HIGH_RISK}
+RISK_GROUP_NAMES = ("low", "high")
 
-    return val
+# Number of uniforms RandomSource draws from NumPy at a time
+RANDOM_BLOCK_SIZE = 65536
+
+# Timelines past the mean + CDF_TABLE_MARGIN ticks have a CDF of 1.0
+CDF_TABLE_MARGIN = 10
+
+def grid_size(grid_area, num_agents):
+    '''
+    (width, height) of the grid for a grid_area setting, which is one of
+    "Demo", "Small" or "Large", a size "WIDTHxHEIGHT" (e.g. "300x120"), or a
+    target density "density=AGENTS_PER_CELL" (e.g. "density=0.1") giving the
+    smallest square grid with at most that many agents per cell. Grids are at
+    least MIN_GRID_SIDE cells each way.
+    '''
+    if grid_area in GRID_SIZES:
+        return GRID_SIZES[grid_area]
+    try:
+        if grid_area.startswith("density="):
+            density = float(grid_area[len("density="):])
+            if density > 0:
+                side = max(MIN_GRID_SIDE, math.ceil(math.sqrt(num_agents / density)))
+                return side, side
+            width = height = None
+        else:
+            width, height = (int(size) for size in grid_area.split("x"))
+    except ValueError:
+        width = height = None
+    if width is None:
+        raise ValueError("Unknown grid_area: {}".format(grid_area))
+    if width < MIN_GRID_SIDE or height < MIN_GRID_SIDE:
+        raise ValueError("Grid too small: {} (needs at least {}x{})".format(
+            grid_area, MIN_GRID_SIDE, MIN_GRID_SIDE))
+    return width, height
+
+@functools.lru_cache(maxsize=None)
+def transition_table(period, mobility):
+    '''
+    Lookup table of the normal CDF used for compartment changes: entry t is the
+    probability of switching at infection_timeline t, for a mean of
+    period*mobility ticks and a standard deviation of 1 tick. Built once per
+    (period, mobility) and shared by every model in the process.
+    '''
+    mean = period*mobility
+    table = scipy.stats.norm.cdf(np.arange(math.ceil(mean) + CDF_TABLE_MARGIN + 1), mean, 1)
+    table.flags.writeable = False
+    return table
+
+@functools.lru_cache(maxsize=None)
+def day_transition_table(period, mobility):
+    '''
+    transition_table in day units, for time_step="day": entry d is the
+    probability of switching at some tick of day d of the infection timeline
+    (ticks (d-1)*mobility+1 to d*mobility), given no switch before that day.
+    '''
+    tick_table = transition_table(period, mobility)
+    days = math.ceil(len(tick_table)/mobility) + 1
+    ticks = np.maximum(np.arange(days)[:, None]*mobility - np.arange(mobility)[::-1], 0)
+    table = 1.0 - np.prod(1.0 - transition_prob(tick_table, ticks), axis=1)
+    table.flags.writeable = False
+    return table
+
+def transition_prob(table, infection_timeline):
+    '''
+    Reads a transition_table at infection_timeline (a number or an array),
+    timelines past the end of the table use its last entry
+    '''
+    return table[np.minimum(infection_timeline, len(table) - 1)]
+
+# Neighbor offsets (dx, dy): up, down, right, left, then the diagonals
+VON_NEUMANN_OFFSETS = ((0, 1), (0, -1), (1, 0), (-1, 0))
+MOORE_OFFSETS = VON_NEUMANN_OFFSETS + ((1, 1), (1, -1), (-1, 1), (-1, -1))
+
+class GridTopology():
+    '''
+    Precomputed neighbor tables of a width x height grid, so moves and
+    neighborhood queries are table lookups. Cell (x, y) is numbered
+    x*height + y. von_neumann and moore are (cells x k) arrays of neighbor
+    cell numbers, center excluded. On a bounded grid the real neighbors of a
+    cell come first (von_neumann_degree/moore_degree of them) and the rest of
+    the row points to the extra cell number num_cells, so count arrays with
+    one spare zero entry at the end can be indexed by a whole row.
+    '''
+    def __init__(self, width, height, torus):
+        self.width = width
+        self.height = height
+        self.torus = torus
+        self.num_cells = width * height
+        x, y = np.divmod(np.arange(self.num_cells), height)
+        self.von_neumann, self.von_neumann_degree = self.neighbor_table(x, y, VON_NEUMANN_OFFSETS)
+        self.moore, self.moore_degree = self.neighbor_table(x, y, MOORE_OFFSETS)
+
+    # plain lists are faster than NumPy for one cell at a time (object
+    # engine), built on first use since the array engine never needs them
+    @functools.cached_property
+    def von_neumann_rows(self):
+        return self.von_neumann.tolist()
+
+    @functools.cached_property
+    def von_neumann_degree_list(self):
+        return self.von_neumann_degree.tolist()
+
+    def neighbor_table(self, x, y, offsets):
+        dx, dy = np.array(offsets).T
+        nx = x[:, None] + dx
+        ny = y[:, None] + dy
+        if self.torus:
+            nx %= self.width
+            ny %= self.height
+            valid = np.ones(nx.shape, dtype=bool)
+        else:
+            valid = (nx >= 0) & (nx < self.width) & (ny >= 0) & (ny < self.height)
+        cells = np.where(valid, nx*self.height + ny, self.num_cells)
+        if self.torus and min(self.width, self.height) <= 2:
+            # offsets can wrap onto the center or onto a neighbor already in
+            # the row, count each cell once
+            center = (x*self.height + y)[:, None]
+            repeated = cells == center
+            for column in range(1, cells.shape[1]):
+                repeated[:, column] |= (cells[:, column, None] == cells[:, :column]).any(axis=1)
+            valid &= ~repeated
+            cells = np.where(valid, cells, self.num_cells)
+        # real neighbors first
+        order = np.argsort(~valid, axis=1, kind="stable")
+        cells = np.take_along_axis(cells, order, axis=1)
+        return cells.astype(np.int32), valid.sum(axis=1).astype(np.int32)
+
+    def cell(self, pos):
+        return pos[0]*self.height + pos[1]
+
+    def position(self, cell):
+        return divmod(cell, self.height)
+
+    def von_neumann_positions(self, pos):
+        '''
+        Von Neumann neighbor positions of pos, center excluded
+        '''
+        cell = pos[0]*self.height + pos[1]
+        row = self.von_neumann_rows[cell]
+        return [divmod(neighbor, self.height) for neighbor in row[:self.von_neumann_degree_list[cell]]]
+
+    def random_step(self, pos, random):
+        '''
+        Random Von Neumann neighbor of pos, drawn with the random.Random random
+        '''
+        cell = pos[0]*self.height + pos[1]
+        neighbor = self.von_neumann_rows[cell][random.randrange(self.von_neumann_degree_list[cell])]
+        return divmod(neighbor, self.height)
+
+    def random_steps(self, cells, uniforms):
+        '''
+        Random Von Neumann neighbor of each cell of an array, picked with an
+        array of uniform draws
+        '''
+        choice = (uniforms * self.von_neumann_degree[cells]).astype(np.int64)
+        return self.von_neumann[cells, choice]
+
+@functools.lru_cache(maxsize=None)
+def grid_topology(width, height, torus=True):
+    '''
+    GridTopology of a grid, built once per size and shared by every model
+    in the process
+    '''
+    return GridTopology(width, height, torus)
+
+class RandomSource():
+    '''
+    Per-model source of random draws for the two-outcome decisions of the model.
+    Uniforms are drawn in blocks from a seeded numpy.random.Generator and
+    served one at a time from the buffer.
+    '''
+    def __init__(self, seed=None, block_size=RANDOM_BLOCK_SIZE):
+        self.generator = np.random.default_rng(seed)
+        self.block_size = block_size
+        self.buffer = []
+        self.index = 0
+
+    def uniform(self):
+        '''
+        Next uniform draw in [0, 1) from the buffer
+        '''
+        if self.index == len(self.buffer):
+            # a list of floats is faster to index than a NumPy array
+            self.buffer = self.generator.random(self.block_size).tolist()
+            self.index = 0
+        draw = self.buffer[self.index]
+        self.index += 1
+        return draw
+
+    def bernoulli(self, prob):
+        '''
+        True with probability prob
+        '''
+        return self.uniform() < prob
+
+    def uniforms(self, size):
+        '''
+        Array of size uniform draws in [0, 1)
+        '''
+        return self.generator.random(size)
+
+    def integers(self, low, high=None, size=None):
+        '''
+        Array of size integers in [low, high), or [0, low) without high
+        '''
+        return self.generator.integers(low, high, size=size)
+
+class PhaseProfiler():
+    '''
+    Cumulative wall time and number of calls of each phase of a model step,
+    recorded when Virus is built with profile=True. Phases: release, move,
+    neighbors (infection-pressure lookups), infection (exposure draws),
+    progression (symptom, recovery and death draws), collect, and step (the
+    whole of Virus.step, which also covers bookkeeping not in any phase).
+    '''
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+
+    def add(self, phase, start):
+        '''
+        Adds the time since start (a time.perf_counter reading) to phase,
+        returns the current reading so phases can be chained
+        '''
+        now = time.perf_counter()
+        self.seconds[phase] += now - start
+        self.calls[phase] += 1
+        return now
+
+    def timed(self, phase, function):
+        '''
+        Wraps function so every call is added to phase
+        '''
+        def timed_function(*args):
+            start = time.perf_counter()
+            result = function(*args)
+            self.add(phase, start)
+            return result
+        return timed_function
+
+    def table(self):
+        '''
+        Dict, keys: phase, value: dict of cumulative seconds and calls
+        '''
+        return {phase: {"seconds": self.seconds[phase], "calls": self.calls[phase]}
+                for phase in self.seconds}
+
+def timed_method(phase, method):
+    '''
+    Wraps an agent method so every call is added to phase of the model's profiler
+    '''
+    def timed(self, *args):
+        start = time.perf_counter()
+        result = method(self, *args)
+        self.model.profiler.add(phase, start)
+        return result
+    return timed
+
+# Parameters reported for each run, in "Model Params" order, with the column
+# type they get in columnar output
+TRACKED_PARAMS = {"num_agents": "int32",
+                  "infectious_seed_pc": "float64",
+                  "recovered_seed_pc": "float64",
+                  "high_risk_pc": "float64",
+                  "grid_area": "string",
+                  "house_init": "string",
+                  "release_strat": "string",
+                  "weeks_to_second_release": "int32",
+                  "mobility_speed": "string",
+                  "fraction_symptomatic": "float64"}
+
+# Per-step columns of the step data, stored as int32 in columnar output
+STEP_COLUMNS = ["Step", "Susceptible", "Exposed", "Infectious", "Recovered", "Dead"]
 
 def track_params(model):
-    return (model.num_agents,
-            model.infectious_seed_pc,
-            model.recovered_seed_pc,
-            model.high_risk_pc,
-            model.grid_area,
-            model.house_init,
-            model.release_strat,
-            model.weeks_to_second_release)
+    return tuple(getattr(model, name) for name in TRACKED_PARAMS)
+
+def run_metadata(model):
+    '''
+    Dict of the tracked parameters of a run, keys: parameter name
+    '''
+    return {name: getattr(model, name) for name in TRACKED_PARAMS}
 
 def track_run(model):
     return model.uid
 
-class VirusModelAgent(Agent):
+def run_step_data(model):
+    '''
+    Step data of a finished run, raises ValueError if it recorded no rows
+    (report_interval="final" on a run stopped before max_days)
+    '''
+    data = model.datacollector.get_model_vars_dataframe()
+    if data.empty:
+        raise ValueError("Run {} recorded no step data: with report_interval='final', "
+                         "max_steps must cover max_days".format(model.uid))
+    return data
+
+class StepDataWriter():
+    '''
+    Model reporter that streams the step data of a finished run to disk from
+    the process that ran it, instead of sending the DataCollector back to the
+    batch runner. With file_format="csv" every worker process appends whole
+    runs to its own CSV file in directory. With file_format="parquet" every
+    run gets its own Parquet file holding only the int32 STEP_COLUMNS, and
+    the parameters of the run travel in the manifest instead, to be written
+    once per run. Either way a crash only loses the runs that had not
+    finished. Returns a small manifest of where the run went.
+    '''
+    def __init__(self, directory, file_format="csv"):
+        if file_format not in ("csv", "parquet"):
+            raise ValueError("Unknown file_format: {}".format(file_format))
+        self.directory = directory
+        self.file_format = file_format
+
+    def __call__(self, model):
+        os.makedirs(self.directory, exist_ok=True)
+        data = run_step_data(model)
+        if self.file_format == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            path = os.path.join(self.directory, "steps_{}_{}.parquet".format(os.getpid(), model.uid))
+            table = pa.table({column: pa.array(data[column].to_numpy(), type=pa.int32())
+                              for column in STEP_COLUMNS})
+            pq.write_table(table, path)
+            return {"path": path, "run": model.uid, "rows": len(data),
+                    "params": run_metadata(model)}
+
+        path = os.path.join(self.directory, "steps_{}.csv".format(os.getpid()))
+        new_file = not os.path.exists(path)
+        # one write per run, flushed to disk before the manifest is returned
+        chunk = data.to_csv(header=new_file, index=False)
+        with open(path, "a") as f:
+            f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        return {"path": path, "run": model.uid, "rows": len(data)}
+
+def merge_step_files(paths, out_path, chunksize=100000):
+    '''
+    Writes the step data in the CSV files written by StepDataWriter to one
+    CSV file at out_path, with the layout of VirusModel_Step_Data.csv. Files
+    are read chunksize rows at a time, so memory use does not grow with the
+    number of runs. Returns the number of rows written.
+    '''
+    rows = 0
+    with open(out_path, "w") as out:
+        for path in paths:
+            for chunk in pd.read_csv(path, chunksize=chunksize):
+                chunk.index = pd.RangeIndex(rows, rows + len(chunk))
+                chunk.to_csv(out, header=(rows == 0))
+                rows += len(chunk)
+    return rows
+
+def merge_parquet_step_files(manifests, steps_path, runs_path, row_group_size=1000000):
+    '''
+    Writes the per-run Parquet files written by StepDataWriter to two Parquet
+    files: steps_path, with an int32 Run column and the int32 STEP_COLUMNS,
+    one row per step, and runs_path, with the Run column and every tracked
+    parameter as its own typed column, one row per run. Runs are numbered
+    from 1 in manifest order (model uids repeat across worker processes)
+    and stored in that order, so readers filtering on Run skip whole row
+    groups. Returns the number of step rows written.
+    '''
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    steps_schema = pa.schema([("Run", pa.int32())] + [(column, pa.int32()) for column in STEP_COLUMNS])
+    runs_schema = pa.schema([("Run", pa.int32())] +
+                            [(name, pa.type_for_alias(kind)) for name, kind in TRACKED_PARAMS.items()])
+    rows = 0
+    pending = []
+    with pq.ParquetWriter(steps_path, steps_schema) as writer:
+        for run, manifest in enumerate(manifests, 1):
+            table = pq.read_table(manifest["path"])
+            pending.append(table.add_column(0, "Run", pa.array(np.full(len(table), run, dtype=np.int32))))
+            rows += len(table)
+            if sum(len(table) for table in pending) >= row_group_size:
+                writer.write_table(pa.concat_tables(pending), row_group_size=row_group_size)
+                pending = []
+        if pending:
+            writer.write_table(pa.concat_tables(pending), row_group_size=row_group_size)
+    runs = [dict(manifest["params"], Run=run) for run, manifest in enumerate(manifests, 1)]
+    pq.write_table(pa.Table.from_pylist(runs, schema=runs_schema), runs_path)
+    return rows
+
+def track_step_series(model):
+    '''
+    Compact step series of a finished run for StepStatistics: its tracked
+    parameters, Step values and an int32 (steps x compartments) array of counts
+    '''
+    data = run_step_data(model)
+    return {"params": track_params(model),
+            "steps": data["Step"].to_numpy(dtype=np.int32),
+            "counts": data[STEP_COLUMNS[1:]].to_numpy(dtype=np.int32)}
+
+class StepStatistics():
+    '''
+    Running mean, standard deviation and standard error of every compartment
+    count at every Step of every parameter combination, updated one run at a
+    time with Welford's method, so replicate series never need to be kept.
+    '''
+    def __init__(self):
+        # keys: tracked parameters, value: dict of Step values, number of
+        # runs, mean and sum of squared deviations at each step (by row)
+        self.groups = dict()
+
+    def add(self, params, steps, counts):
+        '''
+        Adds the counts (steps x compartments array) of one run with the
+        given tracked parameters and Step values
+        '''
+        group = self.groups.get(params)
+        if group is None or len(steps) > len(group["steps"]):
+            group = self.grow(params, steps, counts.shape[1])
+        length = len(steps)
+        if not np.array_equal(group["steps"][:length], steps):
+            raise ValueError("Runs of {} report different steps".format(params))
+        n = group["n"][:length]
+        mean = group["mean"][:length]
+        n += 1
+        delta = counts - mean
+        mean += delta / n[:, None]
+        group["m2"][:length] += delta * (counts - mean)
+
+    def grow(self, params, steps, num_columns):
+        '''
+        Makes room in the group of params for series as long as steps
+        '''
+        old = self.groups.get(params)
+        group = {"steps": np.asarray(steps, dtype=np.int32).copy(),
+                 "n": np.zeros(len(steps), dtype=np.int64),
+                 "mean": np.zeros((len(steps), num_columns)),
+                 "m2": np.zeros((len(steps), num_columns))}
+        if old is not None:
+            length = len(old["steps"])
+            for key in ("n", "mean", "m2"):
+                group[key][:length] = old[key]
+        self.groups[params] = group
+        return group
+
+    def table(self):
+        '''
+        DataFrame with one row per parameter combination and Step: the
+        tracked parameters, Step, Runs, and <Compartment>_mean, _sd and _se
+        for every compartment (sd is the sample standard deviation)
+        '''
+        frames = []
+        for params, group in self.groups.items():
+            n = group["n"]
+            frame = pd.DataFrame({name: [value]*len(n) for name, value in zip(TRACKED_PARAMS, params)})
+            frame["Step"] = group["steps"]
+            frame["Runs"] = n
+            with np.errstate(divide="ignore", invalid="ignore"):
+                sd = np.sqrt(group["m2"] / (n[:, None] - 1))
+            sd[n < 2] = np.nan
+            for column, compartment in enumerate(STEP_COLUMNS[1:]):
+                frame[compartment + "_mean"] = group["mean"][:, column]
+                frame[compartment + "_sd"] = sd[:, column]
+                frame[compartment + "_se"] = sd[:, column] / np.sqrt(n)
+            frames.append(frame)
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
+
+class AggregatingBatchRunner(BatchRunnerMP):
+    '''
+    BatchRunnerMP that hands the "Step Series" report of every run (see
+    track_step_series) to statistics, a StepStatistics, and only keeps the
+    other reports, so the memory of the main process does not grow with the
+    number of steps or replicates. Runs are collected in the order they were
+    submitted, as in BatchRunnerMP, and each is added to statistics as soon
+    as it is collected instead of after the whole batch; runs that finish
+    early wait in the pool until their turn.
+    '''
+    def __init__(self, model_cls, statistics, **kwargs):
+        super().__init__(model_cls, **kwargs)
+        self.statistics = statistics
+
+    def run_all(self):
+        '''
+        Runs the model at all parameter combinations, as BatchRunnerMP.run_all
+        '''
+        run_count = itertools.count()
+        total_iterations, all_kwargs, all_param_values = self._make_model_args()
+        job_queue = []
+        for kwargs, param_values in zip(all_kwargs, all_param_values):
+            for _ in range(self.iterations):
+                job_queue.append(self.pool.uimap(self.run_iteration, (kwargs,),
+                                                 (param_values,), (next(run_count),)))
+        with tqdm(total=total_iterations, disable=not self.display_progress) as pbar:
+            for task in job_queue:
+                for model_vars, agent_vars in task:
+                    self.store_run(model_vars, agent_vars)
+                pbar.update()
+
+    def store_run(self, model_vars, agent_vars):
+        '''
+        Stores the reports of one run, as BatchRunnerMP.run_all, after adding
+        its "Step Series" to statistics
+        '''
+        for model_key, model_val in model_vars.items():
+            series = model_val.pop("Step Series", None)
+            if series is not None:
+                self.statistics.add(**series)
+            self.model_vars[model_key] = model_val
+        if self.agent_reporters:
+            for agent_key, reports in agent_vars.items():
+                self.agent_vars[agent_key] = reports
+
+def track_phase_times(model):
+    '''
+    Phase times of a profiled run with its own labels (tracked parameters
+    and Run, as in the step data), None if the run was not profiled
+    '''
+    if model.profiler is None:
+        return None
+    return {"params": run_metadata(model), "run": model.uid,
+            "phases": model.profiler.table()}
+
+class CompactAgent():
+    '''
+    Slot-based replacement for mesa's Agent base class, with the same
+    unique_id, model, pos and random attributes but no per-instance __dict__
+    (mesa's Agent has one, which costs memory on large populations).
+    '''
+    __slots__ = ("unique_id", "model", "pos")
+
+    def __init__(self, unique_id, model):
+        self.unique_id = unique_id
+        self.model = model
+        self.pos = None
+
+    def step(self):
+        pass
+
+    def advance(self):
+        pass
+
+    @property
+    def random(self):
+        return self.model.random
+
+class VirusModelAgent(CompactAgent):
     '''
     Agent in virus model. Each agent is an individual person.
     '''
+    __slots__ = ("state", "risk", "infection_timeline", "at_home", "next_state")
+
     def __init__(self, pos, model, agent_compartment, risk_group, unique_id):
 
         '''
@@ -70,178 +624,182 @@ class VirusModelAgent(Agent):
          Args:
             unique_id: Unique identifier for the agent.
             x, y: Agent initial location.
-            compartment: String indicating the agent's compartment
-                        (susceptible, exposed, infectious_symptomatic,
-                        infectious_asymptomatic, recovered, dead)
-            risk_group: low (younger, healthy) or high (older, immunocompromised)
+            compartment: Code (or name) of the agent's compartment
+                        (SUSCEPTIBLE, EXPOSED, INFECTIOUS_SYMPTOMATIC,
+                        INFECTIOUS_ASYMPTOMATIC, RECOVERED, DEAD)
+            risk_group: Code (or name) of the agent's risk group, LOW_RISK
+                        (younger, healthy) or HIGH_RISK (older, immunocompromised)
             infection_timeline: days since infected (includes non-infectious period)
         '''
         super().__init__(unique_id, model) # calling the agent class ___init___, inputs (unique_id, model)
         self.pos = pos
-        self.compartment = agent_compartment
-        self.risk_group = risk_group
+        if isinstance(agent_compartment, str):
+            agent_compartment = COMPARTMENT_CODES[agent_compartment]
+        if isinstance(risk_group, str):
+            risk_group = RISK_GROUP_CODES[risk_group]
+        self.state = agent_compartment # compartment code
+        self.risk = risk_group # risk group code
         self.infection_timeline = 0
         self.at_home = True
+        self.next_state = self.state # drawn by plan, applied by advance
+
+    @property
+    def compartment(self):
+        '''
+        Name of the agent's compartment ("susceptible", "exposed", ...)
+        '''
+        return COMPARTMENT_NAMES[self.state]
+
+    @property
+    def risk_group(self):
+        '''
+        Name of the agent's risk group ("low" or "high")
+        '''
+        return RISK_GROUP_NAMES[self.risk]
 
     def move(self):
-        possible_steps = self.model.grid.get_neighborhood(
-            self.pos,
-            moore=False,
-            include_center=False)
-        new_position = self.random.choice(possible_steps)
+        new_position = self.model.topology.random_step(self.pos, self.random)
+        self.model.count_infectious(self.state, self.pos, -1)
         self.model.grid.move_agent(self, new_position)
         self.pos = new_position
+        self.model.count_infectious(self.state, self.pos, 1)
+
+    def change_compartment(self, state):
+        '''
+        Moves the agent to a new compartment (code), keeping the model's
+        infectious-count grids and compartment histogram up to date
+        '''
+        if state != self.state:
+            self.model.count_infectious(self.state, self.pos, -1)
+            self.model.count_compartment(self.state, self.risk, -1)
+            self.state = state
+            self.model.count_infectious(self.state, self.pos, 1)
+            self.model.count_compartment(self.state, self.risk, 1)
 
     def step(self):  # step function
-        if self.compartment == "susceptible":
-            self.model.susceptible_count += 1
-        if self.compartment != "dead":
-            # Release people from quarantine
-            if self.model.release_strat == "Random individual houses":
-                if (self.model.tick % self.model.mobility) == 0:
-                    day = self.model.tick/self.model.mobility
-                    if checkKey(self.model.people_dict, (2500 + day)) == "Present":
-                        people_to_release = self.model.people_dict[2500 + day]
-                        for person in people_to_release:
-                            if self.unique_id == person:
-                                self.at_home = False
-            elif self.model.release_strat == "Random group of houses":
-                # Release random first half of houses at 1st tick
-                if self.model.tick == 0:
-                    counter = len(self.model.people_dict)//2
-                    for x in range(counter):
-                        people_to_release = self.model.people_dict[2500 + x]
-                        for person in people_to_release:
-                            if self.unique_id == person:
-                                self.at_home = False
-                elif self.model.tick == self.model.days_to_second_release*self.model.mobility:
-                    counter = len(self.model.people_dict) - len(self.model.people_dict)//2
-                    for x in range(counter):
-                        x += len(self.model.people_dict)//2
-                        people_to_release = self.model.people_dict[2500 + x]
-                        for person in people_to_release:
-                            if self.unique_id == person:
-                                self.at_home = False
-            elif self.model.release_strat == "Low risk individuals":
-                if self.model.tick == 0:
-                    if self.risk_group == "low":
-                        self.at_home = False
-                elif self.model.tick == self.model.days_to_second_release*self.model.mobility:
-                    if self.risk_group == "high":
-                        self.at_home = False
-            elif self.model.release_strat == "Low risk houses":
-                if self.model.tick == 0:
-                    houses_to_release = self.model.house_dict["low risk houses"]
-                    for house in houses_to_release:
-                        people_to_release = self.model.people_dict[house]
-                        for person in people_to_release:
-                            if self.unique_id == person:
-                                self.at_home = False
-                if self.model.tick == self.model.days_to_second_release*self.model.mobility:
-                    houses_to_release = self.model.house_dict["high risk houses"]
-                    for house in houses_to_release:
-                        people_to_release = self.model.people_dict[house]
-                        for person in people_to_release:
-                            if self.unique_id == person:
-                                self.at_home = False
-            elif self.model.release_strat == "Everyone release":
-                if self.model.tick == 0:
-                    self.at_home = False
-
-            # only move people who are not in quarantine
-            if self.at_home == False:
-                self.move() # calls move method first before checking status of neighbors
-
-            # Built-in get_neighbors function returns a list of neighbors.
-            # Two types of cell neighborhoods: Moore (including diagonals), and
-            # Von Neumann (only up/down/left/right).
-            # Can include an argument as to whether to include the center cell itself as one of the neighbors.
-            if self.compartment == "susceptible":
-                neighbors = self.model.grid.get_neighbors(
-                     self.pos,
-                     moore=False, # uses Von Neumann neighborhoods
-                     include_center=False)
-                for neighbor in neighbors:
-                    # if your neighbor is infectious, you become infectious
-                    if "infectious" in neighbor.compartment: # includes both infectious_symptomatic and infectious_asymptomatic
-                        self.compartment = self.getsInfected(neighbor)
-            elif self.compartment == "exposed":
-                self.model.exposed_count += 1
-                self.infection_timeline += 1 # adds day to infection time
-                self.compartment = self.getsSymptoms()
-            elif "infectious" in self.compartment: # includes both infectious_symptomatic and infectious_asymptomatic
-                self.infection_timeline += 1 # adds day to infection time
-                self.model.infectious_count += 1 # updates count of infectious agents
-                #self.model.infectious_percent = self.model.infectious_count / self.model.agent_count # updates percentage of infectious agents
-                self.compartment = self.getsDead()
-                if self.compartment == "recovered":
-                    self.model.recovered_count += 1
-        else: # self.compartment == dead
-            self.model.dead_count += 1 #updates count of dead agents
-
-    def getsInfected(self, neighbor):
-        '''
-        Determines if, given the neighbor's infectious state, the agent gets infected
-        '''
-        if neighbor.compartment == "infectious_symptomatic":
-            if self.risk_group == "high":
-                transmissionProb = HI_RISK_SYMP_TRANSMISSION
-            else: #self.risk_group == "low"
-                transmissionProb = LOW_RISK_SYMP_TRANSMISSION
-        else: #neighbor.compartment == "infectious_asymptomatic"
-            if self.risk_group == "high":
-                transmissionProb = HI_RISK_ASYMP_TRANSMISSION
-            else: #self.risk_group == "low"
-                transmissionProb = LOW_RISK_ASYMP_TRANSMISSION
-        updatedCompartment = random.choices(["susceptible", "exposed"],
-                                            [(1.0 - transmissionProb), transmissionProb])[0]
-        return updatedCompartment
+        if self.state != DEAD:
+            self.walk() # calls move method first before checking status of neighbors
+            self.change_compartment(self.nextCompartment())
+
+    def walk(self):
+        '''
+        Moves the agent if it is alive and out of quarantine
+        '''
+        # at_home is switched off by Virus.release (see release_schedule)
+        # only move people who are not in quarantine
+        if self.state != DEAD and not self.at_home:
+            self.move()
+
+    def plan(self):
+        '''
+        First phase of a synchronous update: draws the agent's next compartment
+        without changing anything in the model
+        '''
+        if self.state != DEAD:
+            self.next_state = self.nextCompartment()
+
+    def advance(self):
+        '''
+        Second phase of a synchronous update: moves the agent to the
+        compartment drawn by plan
+        '''
+        if self.state != DEAD:
+            self.change_compartment(self.next_state)
+
+    def nextCompartment(self):
+        '''
+        Draws the compartment (code) the agent goes to this tick, advancing
+        its infection timeline
+        '''
+        state = self.state
+        # Infectious neighbors are counted per cell by the model, over the
+        # Von Neumann neighborhood (only up/down/left/right) without the
+        # agent's own cell.
+        if state == SUSCEPTIBLE:
+            symptomatic, asymptomatic = self.model.infection_pressure(self.pos)
+            if symptomatic or asymptomatic:
+                return self.getsInfected(symptomatic, asymptomatic)
+        elif state == EXPOSED:
+            self.infection_timeline += 1 # adds day to infection time
+            return self.getsSymptoms()
+        elif state & INFECTIOUS: # includes both infectious_symptomatic and infectious_asymptomatic
+            self.infection_timeline += 1 # adds day to infection time
+            return self.getsDead()
+        return state
+
+    def getsInfected(self, symptomatic, asymptomatic):
+        '''
+        Determines if, given the number of infectious symptomatic and
+        asymptomatic neighbors, the agent gets infected. Every infectious
+        neighbor is an independent chance of transmission.
+        '''
+        if self.risk == HIGH_RISK:
+            sympTransmissionProb = self.model.hi_risk_symp_transmission
+            asympTransmissionProb = self.model.hi_risk_asymp_transmission
+        else: #self.risk == LOW_RISK
+            sympTransmissionProb = self.model.low_risk_symp_transmission
+            asympTransmissionProb = self.model.low_risk_asymp_transmission
+        escapeProb = (1.0 - sympTransmissionProb)**symptomatic * (1.0 - asympTransmissionProb)**asymptomatic
+        if self.model.rng.bernoulli(1.0 - escapeProb):
+            return EXPOSED
+        return SUSCEPTIBLE
 
     def getsSymptoms(self):
         '''
         Determines if the agent becomes symptomatic or asymptomatic infectious
         '''
         # Calculates CDF of seeing agent's infection timeline given
-        # mean exposure of EXPOSED_PERIOD days with standard deviation of 1 day
-        symptomaticProb = scipy.stats.norm.cdf(self.infection_timeline, EXPOSED_PERIOD*self.model.mobility, 1)
+        # mean exposure of exposed_period days with standard deviation of 1 day
+        symptomaticProb = transition_prob(self.model.symptoms_table, self.infection_timeline)
         # Using calculated probability, pulls updated compartment status from
         # Bernoulli distribution
-        updatedCompartment = random.choices(["infectious_asymptomatic", "infectious_symptomatic"],
-                                            [(1.0 - symptomaticProb), symptomaticProb])[0]
-        return updatedCompartment
+        if self.model.rng.bernoulli(symptomaticProb):
+            return INFECTIOUS_SYMPTOMATIC
+        return INFECTIOUS_ASYMPTOMATIC
 
     def getsDead(self):
         '''
         Determines if, given agent's risk group, the agent dies
         '''
-        if self.compartment == "infectious_symptomatic":
-            switchCompProb = scipy.stats.norm.cdf(self.infection_timeline, SYMPTOMATIC_PERIOD*self.model.mobility, 1)
-            switchComp = random.choices(["switch", "infectious_symptomatic"],
-                                        [switchCompProb, (1.0 - switchCompProb)])[0]
-            if switchComp != "switch":
-                return switchComp
+        if self.state == INFECTIOUS_SYMPTOMATIC:
+            switchCompProb = transition_prob(self.model.symptomatic_table, self.infection_timeline)
+            if not self.model.rng.bernoulli(switchCompProb):
+                return INFECTIOUS_SYMPTOMATIC
             else:
-                if self.risk_group == "high":
-                    deathProb = HI_RISK_DEATH_RATE
-                else: #self.risk_group == "low"
-                    deathProb = LOW_RISK_DEATH_RATE
-        else: #self.compartment == "infectious_asymptomatic"
-            switchCompProb = scipy.stats.norm.cdf(self.infection_timeline, ASYMPTOMATIC_PERIOD*self.model.mobility, 1)
-            switchComp = random.choices(["switch", "infectious_asymptomatic"],
-                                        [switchCompProb, (1.0 - switchCompProb)])[0]
-            if switchComp != "switch":
-                return switchComp
+                if self.risk == HIGH_RISK:
+                    deathProb = self.model.hi_risk_death_rate
+                else: #self.risk == LOW_RISK
+                    deathProb = self.model.low_risk_death_rate
+        else: #self.state == INFECTIOUS_ASYMPTOMATIC
+            switchCompProb = transition_prob(self.model.asymptomatic_table, self.infection_timeline)
+            if not self.model.rng.bernoulli(switchCompProb):
+                return INFECTIOUS_ASYMPTOMATIC
             else:
                 deathProb = 0.0
-        updatedCompartment = random.choices(["recovered", "dead"],
-                                            [(1.0 - deathProb), deathProb])[0]
-        return updatedCompartment
+        if self.model.rng.bernoulli(deathProb):
+            return DEAD
+        return RECOVERED
+
+class ProfiledVirusModelAgent(VirusModelAgent):
+    '''
+    VirusModelAgent that records the time of its step phases in the model's
+    PhaseProfiler, used instead of VirusModelAgent when profile=True so
+    unprofiled runs pay nothing for it
+    '''
+    __slots__ = ()
+    walk = timed_method("move", VirusModelAgent.walk)
+    getsInfected = timed_method("infection", VirusModelAgent.getsInfected)
+    getsSymptoms = timed_method("progression", VirusModelAgent.getsSymptoms)
+    getsDead = timed_method("progression", VirusModelAgent.getsDead)
 
 # Made houses agent for visualization
-class HouseAgent(Agent):
+class HouseAgent(CompactAgent):
     '''
     House cell in virus model. Each agent is an individual person.
     '''
+    __slots__ = ("people_home", "high_risk")
+    compartment = "house"
+
     def __init__(self, pos, model, unique_id, high_risk_house):
         '''
          Create a new HouseAgent agent.
@@ -252,47 +810,328 @@ class HouseAgent(Agent):
         '''
         super().__init__(unique_id, model) # calling the agent class ___init___, inputs (unique_id, model)
         self.pos = pos
-        self.compartment = "house"
         self.people_home = True
         self.high_risk = high_risk_house # boolean
 
     def step(self):
-        if self.model.release_strat == "Random individual houses":
-            if (self.model.tick % self.model.mobility) == 0:
-                day = self.model.tick/self.model.mobility
-                if day == (self.unique_id - 2500):
-                    self.people_home = False
-        elif self.model.release_strat == "Random group of houses":
-            if self.model.tick == 0:
-                counter = len(self.model.people_dict)//2
-                for x in range(counter):
-                    temp_id = 2500 + x
-                    if self.unique_id == temp_id:
-                        self.people_home = False
-            elif self.model.tick == self.model.days_to_second_release*self.model.mobility:
-                counter = len(self.model.people_dict) - len(self.model.people_dict)//2
-                for x in range(counter):
-                    x += len(self.model.people_dict)//2
-                    temp_id = 2500 + x
-                    if self.unique_id == temp_id:
-                        self.people_home = False
-        elif self.model.release_strat == "Low risk individuals":
-            if self.model.tick == 0:
-                if self.high_risk == False:
-                    self.people_home = False
-            if self.model.tick == self.model.days_to_second_release*self.model.mobility:
-                self.people_home = False
-        elif self.model.release_strat == "Low risk houses":
-            houses_to_release = []
-            if self.model.tick == 0:
-                if self.high_risk == False:
-                    self.people_home = False
-            elif self.model.tick == self.model.days_to_second_release*self.model.mobility:
-                if self.high_risk == True:
-                    self.people_home = False
-        elif self.model.release_strat == "Everyone release":
-            if self.model.tick == 0:
-                self.people_home = False
+        # people_home is switched off by Virus.release
+        pass
+
+
+class SynchronousActivation(BaseScheduler):
+    '''
+    Two-phase activation for update="synchronous": every person out of
+    quarantine moves, then every person draws their next compartment from the
+    state the tick is frozen in, then all the changes are applied. Since no
+    agent sees another's change of the same tick, the agents are stepped in
+    the order they were added, without a shuffle.
+    '''
+    def step(self):
+        agents = list(self._agents.values())
+        for agent in agents:
+            agent.walk()
+        for agent in agents:
+            agent.plan()
+        for agent in agents:
+            agent.advance()
+        self.steps += 1
+        self.time += 1
+
+
+class ActiveSetActivation(RandomActivation):
+    '''
+    Random activation over the active set only: people out of quarantine,
+    exposed and infectious people, and susceptible people next to infectious
+    cells. Dormant agents (dead, recovered at home, susceptible at home with no
+    infectious neighbors) are not stepped until they are woken up by a release
+    or by an infectious agent arriving next to their cell.
+    '''
+    def __init__(self, model):
+        super().__init__(model)
+        self.dormant = dict() # keys: unique_id, value: dormant agent
+        # keys: pos, value: dict of the dormant susceptible agents there (by
+        # unique_id, so they are woken up in a reproducible order)
+        self.dormant_susceptible = defaultdict(dict)
+        self.queue = [] # activation order of the current tick
+        self.position = 0 # next agent of the queue to step
+        self.slept = set() # unique_ids of agents put to sleep during this tick
+
+    def can_sleep(self, agent):
+        '''
+        True if stepping the agent cannot change its state until something
+        around it changes
+        '''
+        if agent.state == DEAD:
+            return True
+        if not agent.at_home:
+            return False
+        if agent.state == RECOVERED:
+            return True
+        if agent.state == SUSCEPTIBLE:
+            symptomatic, asymptomatic = self.model.infection_pressure(agent.pos)
+            return not (symptomatic or asymptomatic)
+        return False
+
+    def sleep(self, agent):
+        del self._agents[agent.unique_id]
+        self.dormant[agent.unique_id] = agent
+        if agent.state == SUSCEPTIBLE:
+            self.dormant_susceptible[agent.pos][agent.unique_id] = agent
+        self.slept.add(agent.unique_id)
+
+    def wake(self, agent):
+        if agent.unique_id not in self.dormant:
+            return
+        del self.dormant[agent.unique_id]
+        if agent.state == SUSCEPTIBLE:
+            self.dormant_susceptible[agent.pos].pop(agent.unique_id, None)
+        self._agents[agent.unique_id] = agent
+        if agent.unique_id not in self.slept:
+            # Give the agent the turn it would have had in a full random
+            # activation. If that turn has already passed, its step would
+            # have found no infectious neighbors, so nothing is lost.
+            turn = self.model.random.randint(0, len(self.queue))
+            if turn >= self.position:
+                self.queue.insert(turn, agent)
+
+    def wake_neighbors(self, pos):
+        '''
+        Wakes up the dormant susceptible agents next to pos
+        '''
+        for cell in self.model.topology.von_neumann_positions(pos):
+            for agent in list(self.dormant_susceptible.get(cell, {}).values()):
+                self.wake(agent)
+
+    def step(self):
+        '''
+        Steps the active agents in random order, then puts to sleep the ones
+        that cannot change state
+        '''
+        self.slept.clear()
+        self.queue = list(self._agents.values())
+        self.model.random.shuffle(self.queue)
+        self.position = 0
+        while self.position < len(self.queue):
+            agent = self.queue[self.position]
+            self.position += 1
+            agent.step()
+            if self.can_sleep(agent):
+                self.sleep(agent)
+        self.queue = []
+        self.position = 0
+        self.steps += 1
+        self.time += 1
+
+
+class ArrayEngine():
+    '''
+    Struct-of-arrays engine for the Virus model. Position, compartment,
+    risk group, infection timeline and quarantine state of every person are
+    kept in typed NumPy arrays, and all people are advanced together each tick.
+    '''
+    def __init__(self, model, x, y, compartment, risk):
+        '''
+         Create the engine from the population drawn by the model.
+         Args:
+            model: Virus model the engine advances.
+            x, y: Arrays of initial locations, indexed by person id.
+            compartment: Array of compartment codes.
+            risk: Array of risk group codes.
+        '''
+        self.model = model
+        self.x = np.asarray(x, dtype=np.int32)
+        self.y = np.asarray(y, dtype=np.int32)
+        self.compartment = np.asarray(compartment, dtype=np.int8)
+        self.high_risk = np.asarray(risk) == HIGH_RISK
+        self.infection_timeline = np.zeros(len(self.x), dtype=np.int32)
+        self.at_home = np.ones(len(self.x), dtype=bool)
+
+    def release(self, people):
+        '''
+        Releases the given people (array indices) from quarantine
+        '''
+        self.at_home[people] = False
+
+    def walk(self, steps):
+        '''
+        Draws a random walk of steps von Neumann steps for every released,
+        living person at once, looked up in the model's topology tables.
+        Returns the walkers (array indices) and their path, row j holding the
+        cell of every walker after step j+1.
+        '''
+        walkers = np.flatnonzero(~self.at_home & (self.compartment != DEAD))
+        topology = self.model.topology
+        draws = self.model.rng.uniforms((steps, len(walkers)))
+        path = np.empty((steps, len(walkers)), dtype=np.int32)
+        cells = topology.cell((self.x[walkers], self.y[walkers]))
+        for step in range(steps):
+            cells = topology.random_steps(cells, draws[step])
+            path[step] = cells
+        return walkers, path
+
+    def place(self, people, cells):
+        '''
+        Puts the given people (array indices) at cells, skipping the dead,
+        keeping the model's infectious-count grids up to date
+        '''
+        alive = self.compartment[people] != DEAD
+        people = people[alive]
+        infectious = people[(self.compartment[people] & INFECTIOUS) != 0]
+        self.count_infectious(infectious, -1)
+        self.x[people], self.y[people] = self.model.topology.position(cells[alive])
+        self.count_infectious(infectious, 1)
+
+    def count_infectious(self, people, change):
+        '''
+        Adds change to the model's infectious-count grids at the cells of the
+        given people (array indices), people who are not infectious are skipped
+        '''
+        compartment = self.compartment[people]
+        for code, grid in ((INFECTIOUS_SYMPTOMATIC, self.model.symptomatic_grid),
+                           (INFECTIOUS_ASYMPTOMATIC, self.model.asymptomatic_grid)):
+            members = people[compartment == code]
+            np.add.at(grid, (self.x[members], self.y[members]), change)
+
+    def change_compartment(self, people, compartment):
+        '''
+        Moves the given people (array indices) to compartment (a code or an
+        array of codes), keeping the model's infectious-count grids and
+        compartment histogram up to date
+        '''
+        histogram = self.model.compartment_counts
+        risk = self.high_risk[people].astype(np.int8)
+        self.count_infectious(people, -1)
+        np.subtract.at(histogram, (self.compartment[people], risk), 1)
+        self.compartment[people] = compartment
+        self.count_infectious(people, 1)
+        np.add.at(histogram, (self.compartment[people], risk), 1)
+
+    def infect(self, susceptible):
+        '''
+        Exposes susceptible people next to infectious people. Every infectious
+        neighbor is an independent chance of transmission.
+        '''
+        symptomatic, asymptomatic = self.model.infection_pressure((self.x[susceptible],
+                                                                   self.y[susceptible]))
+        self.expose(susceptible, symptomatic, asymptomatic)
+
+    def expose(self, susceptible, symptomatic, asymptomatic):
+        '''
+        Exposes susceptible people (array indices) who had symptomatic and
+        asymptomatic contacts (arrays, by person) with infectious people.
+        Every contact is an independent chance of transmission.
+        '''
+        high_risk = self.high_risk[susceptible]
+        model = self.model
+        symp_prob = np.where(high_risk, model.hi_risk_symp_transmission,
+                             model.low_risk_symp_transmission)
+        asymp_prob = np.where(high_risk, model.hi_risk_asymp_transmission,
+                              model.low_risk_asymp_transmission)
+        escape_prob = (1.0 - symp_prob)**symptomatic * (1.0 - asymp_prob)**asymptomatic
+        infected = model.rng.uniforms(len(susceptible)) >= escape_prob
+        self.change_compartment(susceptible[infected], EXPOSED)
+
+    def progress(self, exposed, infectious):
+        '''
+        Advances the infection timeline of exposed and infectious people and
+        draws their compartment changes, as getsSymptoms and getsDead do
+        '''
+        model = self.model
+        self.infection_timeline[exposed] += 1
+        self.infection_timeline[infectious] += 1
+
+        symptomatic_prob = transition_prob(model.symptoms_table, self.infection_timeline[exposed])
+        symptomatic = self.model.rng.uniforms(len(exposed)) < symptomatic_prob
+        self.change_compartment(exposed, np.where(symptomatic, INFECTIOUS_SYMPTOMATIC,
+                                                  INFECTIOUS_ASYMPTOMATIC))
+
+        was_symptomatic = self.compartment[infectious] == INFECTIOUS_SYMPTOMATIC
+        timeline = self.infection_timeline[infectious]
+        switch_prob = np.where(was_symptomatic,
+                               transition_prob(model.symptomatic_table, timeline),
+                               transition_prob(model.asymptomatic_table, timeline))
+        switch = self.model.rng.uniforms(len(infectious)) < switch_prob
+        death_rate = np.where(self.high_risk[infectious], model.hi_risk_death_rate,
+                              model.low_risk_death_rate)
+        death_prob = np.where(was_symptomatic, death_rate, 0.0)
+        dies = self.model.rng.uniforms(len(infectious)) < death_prob
+        self.change_compartment(infectious[switch], np.where(dies[switch], DEAD, RECOVERED))
+
+    def step(self):
+        '''
+        Advances every person by model.substeps ticks. The walk of the whole
+        step is drawn at once, and people are only put on their path (and
+        infection checked) at the sub-steps in model.infection_substeps.
+        Exposed and infectious people progress every sub-step.
+        '''
+        walkers, path = self.walk(self.model.substeps)
+        for substep in range(self.model.substeps):
+            exposed = np.flatnonzero(self.compartment == EXPOSED)
+            infectious = np.flatnonzero(self.compartment & INFECTIOUS)
+            if substep in self.model.infection_substeps:
+                self.place(walkers, path[substep])
+                self.infect(np.flatnonzero(self.compartment == SUSCEPTIBLE))
+            self.progress(exposed, infectious)
+        if self.model.substeps - 1 not in self.model.infection_substeps:
+            self.place(walkers, path[-1])
+
+    def step_day(self):
+        '''
+        Advances every person by one day (time_step="day"). Everyone released
+        walks the day's mobility ticks at once, and a susceptible person meets
+        the infectious neighbors of their cell at every tick of the day, with
+        the compartments frozen at the start of the day. People exposed during
+        the day progress that day too: changes only apply at the end of a day,
+        and this keeps the mean time from exposure to being infectious the
+        same as in the tick-level model.
+        '''
+        model = self.model
+        topology = model.topology
+        walkers, path = self.walk(model.mobility)
+        infectious = np.flatnonzero(self.compartment & INFECTIOUS)
+        susceptible = np.flatnonzero(self.compartment == SUSCEPTIBLE)
+
+        cells = topology.cell((self.x, self.y))
+        walking = np.zeros(len(cells), dtype=bool)
+        walking[walkers] = True
+        # cell of every susceptible person, walkers are moved along their path each tick
+        susceptible_cells = cells[susceptible]
+        susceptible_walking = np.flatnonzero(walking[susceptible])
+        susceptible_path = path[:, np.searchsorted(walkers, susceptible[susceptible_walking])]
+        codes = (INFECTIOUS_SYMPTOMATIC, INFECTIOUS_ASYMPTOMATIC)
+        # infectious neighbors of each cell, from the infectious people who stay put
+        staying = [np.bincount(topology.von_neumann[cells[(self.compartment == code) & ~walking]].ravel(),
+                               minlength=topology.num_cells + 1) for code in codes]
+        moving = [path[:, self.compartment[walkers] == code] for code in codes]
+        contacts = [np.zeros(len(susceptible), dtype=np.int64) for code in codes]
+        for tick in range(model.mobility):
+            susceptible_cells[susceptible_walking] = susceptible_path[tick]
+            for group in range(len(codes)):
+                neighbors = staying[group] + np.bincount(topology.von_neumann[moving[group][tick]].ravel(),
+                                                         minlength=topology.num_cells + 1)
+                contacts[group] += neighbors[susceptible_cells]
+        self.expose(susceptible, *contacts)
+        exposed = np.flatnonzero(self.compartment == EXPOSED)
+        self.progress(exposed, infectious)
+        self.place(walkers, path[-1])
+
+
+class HouseReleaseSchedule():
+    '''
+    Release schedule of "Random individual houses": house h and its people
+    are released at tick h*ticks_per_day. Events are made when a tick asks
+    for them, so building it does not loop over the houses.
+    '''
+    def __init__(self, house_offsets, ticks_per_day):
+        self.house_offsets = house_offsets
+        self.ticks_per_day = ticks_per_day
+
+    def get(self, tick):
+        house, offset = divmod(tick, self.ticks_per_day)
+        if offset or house >= len(self.house_offsets) - 1:
+            return None
+        return (np.arange(self.house_offsets[house], self.house_offsets[house + 1]),
+                np.array([house]))
 
 
 class Virus(Model):
@@ -307,43 +1146,118 @@ class Virus(Model):
                 num_agents=100, infectious_seed_pc=INFECTIOUS_PREVALENCE,
                 recovered_seed_pc=0.2, high_risk_pc=FRACTION_HI_RISK,
                 house_init="Random", release_strat= "Random individual houses",
-                mobility_speed = "low", weeks_to_second_release = 4):
+                mobility_speed = "low", weeks_to_second_release = 4,
+                engine="object", scheduler="random", substeps=1,
+                infection_substeps=None, time_step="tick", update=None,
+                profile=False, max_days=None, report_interval=1,
+                fraction_symptomatic=FRACTION_SYMPTOMATIC, exposed_period=EXPOSED_PERIOD,
+                asymptomatic_period=ASYMPTOMATIC_PERIOD, symptomatic_period=SYMPTOMATIC_PERIOD,
+                low_risk_asymp_transmission=LOW_RISK_ASYMP_TRANSMISSION,
+                hi_risk_asymp_transmission=HI_RISK_ASYMP_TRANSMISSION,
+                low_risk_symp_transmission=LOW_RISK_SYMP_TRANSMISSION,
+                hi_risk_symp_transmission=HI_RISK_SYMP_TRANSMISSION,
+                hi_risk_death_rate=HI_RISK_DEATH_RATE, low_risk_death_rate=LOW_RISK_DEATH_RATE,
+                seed=None):
         # model is seeded with default parameters
         # can also change defaults with user settable parameter slider in GUI
+        # engine = "object" steps one Mesa agent at a time,
+        # engine = "array" advances everyone at once with NumPy (see ArrayEngine)
+        # scheduler (object engine) = "random" steps every agent each tick,
+        # "active" only steps agents who can change state (see ActiveSetActivation)
+        # substeps (array engine) = number of ticks one model step advances,
+        # infection_substeps = sub-steps (0 to substeps-1) at which infection is
+        # checked, all of them by default (see ArrayEngine.step)
+        # update = "sequential" applies each agent's changes as it steps (object
+        # engine default), "synchronous" draws every change from the state at
+        # the start of the tick and then applies them all (array engine, and
+        # object engine with SynchronousActivation)
+        # max_days = number of simulated days after which the model stops
+        # running (None runs until BatchRunner's max_steps), so runs of
+        # different mobility can share one batch
+        # report_interval = how often datacollector records a row: every k
+        # ticks (an int), "day" once per simulated day, "final" only the state
+        # when the model stops after max_days (see report); a run cut short
+        # before max_days (e.g. by BatchRunner's max_steps) then records nothing
+        # fraction_symptomatic ... low_risk_death_rate = epidemiological
+        # assumptions, default to the module constants of the same name
+        # profile = True records the time spent in each phase of a step in
+        # self.profiler (see PhaseProfiler)
+        # time_step (array engine) = "tick" steps one tick (1/mobility day) at a
+        # time, "day" steps a whole day at a time (see ArrayEngine.step_day)
+
+        if engine not in ("object", "array"):
+            raise ValueError("Unknown engine: {}".format(engine))
+        if scheduler not in ("random", "active"):
+            raise ValueError("Unknown scheduler: {}".format(scheduler))
+        if substeps < 1 or (substeps > 1 and engine != "array"):
+            raise ValueError("substeps must be 1, or more with engine='array'")
+        if infection_substeps is None:
+            infection_substeps = range(substeps)
+        infection_substeps = frozenset(infection_substeps)
+        if not infection_substeps <= set(range(substeps)):
+            raise ValueError("infection_substeps must be between 0 and substeps-1")
+        if update is None:
+            update = "synchronous" if engine == "array" else "sequential"
+        if update not in ("sequential", "synchronous"):
+            raise ValueError("Unknown update: {}".format(update))
+        if update == "sequential" and engine == "array":
+            raise ValueError("The array engine only supports update='synchronous'")
+        if update == "synchronous" and scheduler == "active":
+            raise ValueError("scheduler='active' only supports update='sequential'")
+        if time_step not in ("tick", "day"):
+            raise ValueError("Unknown time_step: {}".format(time_step))
+        if time_step == "day" and (engine != "array" or substeps != 1):
+            raise ValueError("time_step='day' needs engine='array' and substeps=1")
+        if report_interval == "final" and max_days is None:
+            raise ValueError("report_interval='final' needs max_days")
+        if report_interval not in ("day", "final") and (
+                not isinstance(report_interval, int) or report_interval < 1):
+            raise ValueError("Unknown report_interval: {}".format(report_interval))
 
         self.uid = next(self.id_gen)
+        # seed (read by mesa's Model.__new__) also seeds self.random
+        self.rng = RandomSource(self.random.getrandbits(64))
         self.grid_area = grid_area
         self.house_init = house_init
         self.release_strat = release_strat
         self.weeks_to_second_release = weeks_to_second_release
-        if grid_area == "Demo":
-            self.height = GRID_HEIGHT_DEMO # height and width of grid
-            self.width = GRID_WIDTH_DEMO
-        elif grid_area == "Small":
-            self.height = GRID_HEIGHT_SMALL
-            self.width = GRID_WIDTH_SMALL
-        elif grid_area == "Large":
-            self.height = GRID_HEIGHT_LARGE
-            self.width = GRID_WIDTH_LARGE
+        self.width, self.height = grid_size(grid_area, num_agents) # width and height of grid
         self.num_agents = num_agents # number of agents to initializse
         self.infectious_seed_pc = infectious_seed_pc # percent of infectious agents at start of simulation
         self.recovered_seed_pc = recovered_seed_pc # percent of recovered agents at start of simulation
         self.high_risk_pc = high_risk_pc # percent of agents catergorized as high risk for severe disease
 
-        self.schedule = RandomActivation(self) # controls the order that agents are activated and step
-        self.grid = MultiGrid(self.width, self.height, torus=True) # multiple agents per cell
+        # controls the order that agents are activated and step
+        self.scheduler = scheduler
+        self.update = update
+        if scheduler == "active":
+            self.schedule = ActiveSetActivation(self)
+        elif update == "synchronous":
+            self.schedule = SynchronousActivation(self)
+        else:
+            self.schedule = RandomActivation(self)
+        # multiple agents per cell, only the object engine places agents on it
+        self.grid = MultiGrid(self.width, self.height, torus=True) if engine == "object" else None
+        self.topology = grid_topology(self.width, self.height, True) # neighbor tables
+        # number of infectious symptomatic/asymptomatic agents in each cell, by
+        # cell number plus one spare zero entry (see GridTopology); the grids
+        # are (width, height) views of the same counts
+        self.symptomatic_cells = np.zeros(self.topology.num_cells + 1, dtype=np.int32)
+        self.asymptomatic_cells = np.zeros(self.topology.num_cells + 1, dtype=np.int32)
+        self.symptomatic_grid = self.symptomatic_cells[:-1].reshape(self.width, self.height)
+        self.asymptomatic_grid = self.asymptomatic_cells[:-1].reshape(self.width, self.height)
 
-        self.infectious_count = 0
-        self.infectious_percent = 0
-        self.dead_count = 0
-        self.susceptible_count = 0
-        self.exposed_count = 0
-        self.recovered_count = 0
+        # number of agents in each compartment (row, by code) and risk group
+        # (column, 0 = low, 1 = high), updated whenever an agent changes compartment
+        self.compartment_counts = np.zeros((DEAD + 1, 2), dtype=np.int64)
         self.step_count = 0
 
         self.tick = 0
-        self.people_dict = dict() # keys: house_ids, value: people_ids of people at that house
-        self.house_dict = dict() # keys: low/high risk houses, value: house_ids of corresponding houses
+        self.people = [] # VirusModelAgents, indexed by person id
+        # People and houses have separate ids, both counting up from 0, so they
+        # can be used as array offsets
+        self.houses = [] # HouseAgents, indexed by house id
+        self.house_dict = dict() # keys: low/high risk houses, value: array of house_ids of corresponding houses
         self.release_strat = release_strat
 
         if mobility_speed == "low":
@@ -354,123 +1268,109 @@ class Virus(Model):
             self.mobility = 1
 
         self.days_to_second_release = 7*weeks_to_second_release
+        self.mobility_speed = mobility_speed
+        self.max_days = max_days
+
+        # epidemiological assumptions (see the module constants)
+        self.fraction_symptomatic = fraction_symptomatic
+        self.exposed_period = exposed_period # days
+        self.asymptomatic_period = asymptomatic_period # days
+        self.symptomatic_period = symptomatic_period # days
+        self.low_risk_asymp_transmission = low_risk_asymp_transmission
+        self.hi_risk_asymp_transmission = hi_risk_asymp_transmission
+        self.low_risk_symp_transmission = low_risk_symp_transmission
+        self.hi_risk_symp_transmission = hi_risk_symp_transmission
+        self.hi_risk_death_rate = hi_risk_death_rate
+        self.low_risk_death_rate = low_risk_death_rate
+
+        # CDF lookup tables for getsSymptoms and getsDead, in ticks or days
+        self.time_step = time_step
+        if time_step == "day":
+            self.ticks_per_day = 1
+            table = day_transition_table
+        else:
+            self.ticks_per_day = self.mobility
+            table = transition_table
+        # ticks between two rows of datacollector, None = final state only
+        if report_interval == "day":
+            self.report_ticks = self.ticks_per_day
+        elif report_interval == "final":
+            self.report_ticks = None
+        else:
+            self.report_ticks = report_interval
+        self.symptoms_table = table(exposed_period, self.mobility)
+        self.symptomatic_table = table(symptomatic_period, self.mobility)
+        self.asymptomatic_table = table(asymptomatic_period, self.mobility)
 
         ### Set up agents and houses ###
+        # Everything is drawn in bulk with NumPy: household sizes, then the
+        # people (risk group and seed compartment) and the house locations.
         # First initialize vec defining number of agents per cell/house (between 1-4)
-        agents_per_cell = []
-        agents_sum = 0
+        agents_per_cell = self.household_sizes(num_agents)
+        num_houses = len(agents_per_cell)
+        # house id of each person, and id of the first person of each house
+        # (people of house h are house_offsets[h] up to house_offsets[h+1])
+        self.house_of_person = np.repeat(np.arange(num_houses, dtype=np.int32), agents_per_cell)
+        self.house_offsets = np.concatenate(([0], np.cumsum(agents_per_cell)))
 
-        while agents_sum < (num_agents-4):
-            agents_per_cell.append(random.randint(1,4))
-            agents_sum = sum(agents_per_cell)
+        risk = np.where(self.rng.uniforms(num_agents) < self.high_risk_pc, HIGH_RISK, LOW_RISK)
+        # From Joshua Weitz paper
+        # Basic epi parameters, 0.1% total prevalence
+        # (90% asymptomatic, 10% symptomatic)
+        infectious = self.rng.uniforms(num_agents) < self.infectious_seed_pc
+        symptomatic = self.rng.uniforms(num_agents) < self.fraction_symptomatic
+        recovered = ~infectious & (self.rng.uniforms(num_agents) < self.recovered_seed_pc)
+        compartment = np.full(num_agents, SUSCEPTIBLE, dtype=np.int8)
+        compartment[infectious] = np.where(symptomatic[infectious], INFECTIOUS_SYMPTOMATIC,
+                                           INFECTIOUS_ASYMPTOMATIC)
+        compartment[recovered] = RECOVERED
 
-        while agents_sum != num_agents:
-            temp = num_agents - agents_sum
-            agents_per_cell.append(random.randint(1,temp))
-            agents_sum = sum(agents_per_cell)
+        # a house is high risk if anyone living there is high risk
+        high_risk_house = np.bincount(self.house_of_person, weights=risk, minlength=num_houses) > 0
+        house_x, house_y = self.house_locations(house_init, num_houses)
+        x = house_x[self.house_of_person]
+        y = house_y[self.house_of_person]
 
-        # Now initialize these agents on the grid in houses
-        person_id = 0
-        house_id = 2500
+        np.add.at(self.compartment_counts, (compartment, risk), 1)
+        for code, grid in ((INFECTIOUS_SYMPTOMATIC, self.symptomatic_grid),
+                           (INFECTIOUS_ASYMPTOMATIC, self.asymptomatic_grid)):
+            members = compartment == code
+            np.add.at(grid, (x[members], y[members]), 1)
 
-        high_risk_houses = []
-        low_risk_houses = []
+        self.house_dict["low risk houses"] = np.flatnonzero(~high_risk_house)
+        self.house_dict["high risk houses"] = np.flatnonzero(high_risk_house)
 
-        # For uniform neighborhood, approximate with square packing of circles
-        # in a rectangle
-        # Getting indices of where houses should be
-        # Initialing array of tuples with random grid coordinates
-        num_houses = len(agents_per_cell)
-        house_locations = []
-        if house_init == "Neighborhood":
-            grid_area = self.grid.width * self.grid.height
-            circle_radius = math.sqrt(grid_area / (4.0 * num_houses))
-            circle_diameter = 2.0 * circle_radius
-            floor_radius = math.floor(circle_radius)
-            floor_diameter = math.floor(circle_diameter)
-            # Checking for feasibility:
-            if floor_diameter < 1:
-                raise ValueError("Too many agents to fit on grid.")
-            # number of houses for each row of grid
-            num_each_row = 1 + math.floor((self.grid.width - floor_radius) / floor_diameter)
-            # number of houses for each column of grid
-            num_each_col = 1 + math.floor((self.grid.height - floor_radius) / floor_diameter)
-            for j in range(num_each_col):
-                for i in range(num_each_row):
-                    xpos = floor_radius + i * floor_diameter
-                    ypos = floor_radius + j * floor_diameter
-                    if xpos < self.grid.width and ypos < self.grid.height:
-                        house_locations.append((xpos, ypos))
+        # keys: tick, value: (people_ids, house_ids) released at that tick
+        self.release_schedule = self.compile_release_schedule(risk)
 
-        # Initializing different household styles
-        # Neighborhood = households laid out in uniform pattern on grid
-        # Rural = households widely spread out
-        # Clusters = households grouped in two clusters with larger space in between
-        cell_counter = 0
-        for cell in agents_per_cell:
-            if house_init == "Random":
-                x = self.random.randrange(self.grid.width)
-                y = self.random.randrange(self.grid.height)
-            elif house_init == "Neighborhood":
-                x = house_locations[cell_counter][0]
-                y = house_locations[cell_counter][1]
-                cell_counter += 1
-            else: #house_init == "Clusters"
-                # Households will be created on first 9th and last 9th
-                # of grid (torus wrap turned off)
-                one_sixth_width = int(self.grid.width / 6)
-                x_low = self.random.randrange(one_sixth_width, 2*one_sixth_width)
-                x_high = self.random.randrange(4*one_sixth_width, 5*one_sixth_width)
-                x = random.choice([x_low, x_high])
-                one_sixth_height = int(self.grid.height / 6)
-                y_low = self.random.randrange(one_sixth_height, 2*one_sixth_height)
-                y_high = self.random.randrange(4*one_sixth_height, 5*one_sixth_height)
-                y = random.choice([y_low, y_high])
-
-            people_here = []
-            high_risk_house = False
-            # Initialize people at house at (x,y)
-            for person in range(cell):
-                if self.random.random() < self.high_risk_pc:
-                    risk_group = "high"
-                    high_risk_house = True
-                else:
-                    risk_group = "low"
-
-                if self.random.random() < self.infectious_seed_pc:
-                    # From Joshua Weitz paper
-                    # Basic epi parameters, 0.1% total prevalence
-                    # (90% asymptomatic, 10% symptomatic)
-                    agent_compartment = random.choices(["infectious_asymptomatic", "infectious_symptomatic"],
-                                                        [(1.0 - FRACTION_SYMPTOMATIC), FRACTION_SYMPTOMATIC])[0]
-                    self.infectious_count += 1
-
-                elif self.random.random() < self.recovered_seed_pc:
-                    agent_compartment = "recovered"
-                    self.recovered_count += 1
-
-                else:
-                    agent_compartment = "susceptible"
-                    self.susceptible_count += 1
-
-                agent = VirusModelAgent((x, y), self, agent_compartment, risk_group, person_id)
-                self.grid.place_agent(agent, (x, y))
+        self.engine = engine
+        self.substeps = substeps
+        self.infection_substeps = infection_substeps
+        # time per step phase, None when not profiling
+        self.profiler = PhaseProfiler() if profile else None
+        if self.profiler is not None:
+            self.infection_pressure = self.profiler.timed("neighbors", self.infection_pressure)
+        if engine == "array":
+            self.array_engine = ArrayEngine(self, x, y, compartment, risk)
+            if self.profiler is not None:
+                for phase, method in (("move", "walk"), ("move", "place"),
+                                      ("infection", "expose"), ("progression", "progress")):
+                    setattr(self.array_engine, method,
+                            self.profiler.timed(phase, getattr(self.array_engine, method)))
+        else:
+            person_class = ProfiledVirusModelAgent if profile else VirusModelAgent
+            # Now initialize these agents on the grid in houses
+            for person_id, (pos, state, risk_group) in enumerate(zip(zip(x.tolist(), y.tolist()),
+                                                                     compartment.tolist(), risk.tolist())):
+                agent = person_class(pos, self, state, risk_group, person_id)
+                self.grid.place_agent(agent, pos)
                 self.schedule.add(agent)
-                people_here.append(person_id)
-                person_id += 1
-
-            if high_risk_house == False:
-                low_risk_houses.append(house_id)
-            else:
-                high_risk_houses.append(house_id)
-            house = HouseAgent((x,y), self, house_id, high_risk_house)
-            self.grid.place_agent(house, (x, y))
-            self.schedule.add(house)
-            self.people_dict[house_id] = people_here
-            house_id+=1
-
-        self.house_dict["low risk houses"] = low_risk_houses
-        self.house_dict["high risk houses"] = high_risk_houses
+                self.people.append(agent)
+            for house_id, (pos, high_risk) in enumerate(zip(zip(house_x.tolist(), house_y.tolist()),
+                                                            high_risk_house.tolist())):
+                house = HouseAgent(pos, self, house_id, high_risk)
+                self.grid.place_agent(house, pos) # houses are drawn, not stepped
+                self.houses.append(house)
 
         # uses DataCollector built in module to collect data from each model run
         self.s_datacollector = DataCollector(
@@ -502,64 +1402,374 @@ class Virus(Model):
                              "Dead": "dead_count",
                              "Model Params": track_params,
                              "Run": track_run})
-        self.datacollector.collect(self)
+        if self.report_ticks is not None:
+            self.datacollector.collect(self)
 
         self.running = True
 
 
+    @property
+    def susceptible_count(self):
+        return int(self.compartment_counts[SUSCEPTIBLE].sum())
+
+    @property
+    def exposed_count(self):
+        return int(self.compartment_counts[EXPOSED].sum())
+
+    @property
+    def infectious_count(self):
+        return int(self.compartment_counts[INFECTIOUS_SYMPTOMATIC].sum() +
+                   self.compartment_counts[INFECTIOUS_ASYMPTOMATIC].sum())
+
+    @property
+    def recovered_count(self):
+        return int(self.compartment_counts[RECOVERED].sum())
+
+    @property
+    def dead_count(self):
+        return int(self.compartment_counts[DEAD].sum())
+
+    def count_compartment(self, state, risk, change):
+        '''
+        Adds change to the compartment histogram at compartment code state and
+        risk group code risk
+        '''
+        self.compartment_counts[state, risk] += change
+
+    def count_infectious(self, state, pos, change):
+        '''
+        Adds change to the infectious-count grid of compartment code state at
+        pos, compartments that are not infectious are ignored
+        '''
+        if state == INFECTIOUS_SYMPTOMATIC:
+            self.symptomatic_grid[pos] += change
+        elif state == INFECTIOUS_ASYMPTOMATIC:
+            self.asymptomatic_grid[pos] += change
+        else:
+            return
+        if change > 0 and self.scheduler == "active":
+            self.schedule.wake_neighbors(pos)
+
+    def infection_pressure(self, pos):
+        '''
+        Number of infectious symptomatic and asymptomatic agents in the Von
+        Neumann neighborhood of pos (center cell excluded), read from the
+        topology tables. pos can also be a pair of coordinate arrays.
+        '''
+        cell = self.topology.cell(pos)
+        if isinstance(cell, int):
+            row = self.topology.von_neumann_rows[cell]
+            return (sum(self.symptomatic_cells[neighbor] for neighbor in row),
+                    sum(self.asymptomatic_cells[neighbor] for neighbor in row))
+        neighbors = self.topology.von_neumann[cell]
+        return (self.symptomatic_cells[neighbors].sum(axis=-1),
+                self.asymptomatic_cells[neighbors].sum(axis=-1))
+
+    def household_sizes(self, num_agents):
+        '''
+        Draws the number of people in each house (between 1-4), adding up to num_agents
+        '''
+        # houses have 2.5 people on average, draw a few more than needed
+        sizes = self.rng.integers(1, 5, size=num_agents//2 + 4)
+        while sizes.sum() < num_agents - 4:
+            sizes = np.concatenate((sizes, self.rng.integers(1, 5, size=num_agents//2 + 4)))
+        # keep houses until there are at least num_agents-4 people...
+        totals = np.cumsum(sizes)
+        sizes = sizes[:np.searchsorted(totals, num_agents - 4) + 1] if num_agents > 4 else sizes[:0]
+        agents_sum = int(sizes.sum())
+        # ...and fill the last few people in
+        extra = []
+        while agents_sum != num_agents:
+            extra.append(int(self.rng.integers(1, num_agents - agents_sum + 1)))
+            agents_sum += extra[-1]
+        return np.concatenate((sizes, np.array(extra, dtype=sizes.dtype)))
+
+    def house_locations(self, house_init, num_houses):
+        '''
+        Draws the (x, y) location of each house, returns two arrays
+        '''
+        # Initializing different household styles
+        # Neighborhood = households laid out in uniform pattern on grid
+        # Rural = households widely spread out
+        # Clusters = households grouped in two clusters with larger space in between
+        if house_init == "Random":
+            x = self.rng.integers(self.width, size=num_houses)
+            y = self.rng.integers(self.height, size=num_houses)
+        elif house_init == "Neighborhood":
+            # For uniform neighborhood, lay houses out on a lattice with about
+            # the aspect ratio of the grid, evenly spaced along each axis
+            width, height = self.width, self.height
+            # Checking for feasibility:
+            if num_houses > width * height:
+                raise ValueError("Too many houses to fit on grid.")
+            columns = min(width, max(1, round(math.sqrt(num_houses * width / height))))
+            rows = min(height, math.ceil(num_houses / columns))
+            columns = math.ceil(num_houses / rows)
+            # house coordinates along each row and each column of grid
+            xs = ((np.arange(columns) + 0.5) * width / columns).astype(np.int64)
+            ys = ((np.arange(rows) + 0.5) * height / rows).astype(np.int64)
+            x, y = np.meshgrid(xs, ys)
+            x = x.ravel()[:num_houses]
+            y = y.ravel()[:num_houses]
+        else: #house_init == "Clusters"
+            if min(self.width, self.height) < MIN_CLUSTERS_GRID_SIDE:
+                raise ValueError("Grid too small for Clusters houses: {}x{} (needs at least {}x{})".format(
+                    self.width, self.height, MIN_CLUSTERS_GRID_SIDE, MIN_CLUSTERS_GRID_SIDE))
+            # Households will be created on first 9th and last 9th
+            # of grid (torus wrap turned off)
+            one_sixth_width = int(self.width / 6)
+            x_low = self.rng.integers(one_sixth_width, 2*one_sixth_width, size=num_houses)
+            x_high = self.rng.integers(4*one_sixth_width, 5*one_sixth_width, size=num_houses)
+            x = np.where(self.rng.uniforms(num_houses) < 0.5, x_high, x_low)
+            one_sixth_height = int(self.height / 6)
+            y_low = self.rng.integers(one_sixth_height, 2*one_sixth_height, size=num_houses)
+            y_high = self.rng.integers(4*one_sixth_height, 5*one_sixth_height, size=num_houses)
+            y = np.where(self.rng.uniforms(num_houses) < 0.5, y_high, y_low)
+        return x.astype(np.int32), y.astype(np.int32)
+
+    def people_in_house(self, house_id):
+        '''
+        Ids of the people living in house house_id
+        '''
+        return range(self.house_offsets[house_id], self.house_offsets[house_id + 1])
+
+    def compile_release_schedule(self, risk):
+        '''
+        Turns release_strat into a table of release events, so a tick only
+        pays for the people it actually releases.
+        Args:
+            risk: Array of risk group codes, indexed by person id.
+        Returns dict, keys: tick, value: (array of people_ids, array of house_ids),
+        or a HouseReleaseSchedule with the same get method
+        '''
+        second_release = self.days_to_second_release*self.ticks_per_day
+        num_houses = len(self.house_offsets) - 1
+        events = dict()
+
+        def add_event(tick, houses, people=None):
+            houses = np.asarray(houses, dtype=np.int64)
+            if people is None:
+                released = np.zeros(num_houses, dtype=bool)
+                released[houses] = True
+                people = np.flatnonzero(released[self.house_of_person])
+            if tick in events:
+                old_people, old_houses = events[tick]
+                people = np.concatenate((old_people, people))
+                houses = np.concatenate((old_houses, houses))
+            events[tick] = (np.asarray(people, dtype=np.int64), houses)
+
+        if self.release_strat == "Random individual houses":
+            # one house per day
+            return HouseReleaseSchedule(self.house_offsets, self.ticks_per_day)
+        elif self.release_strat == "Random group of houses":
+            # first half of houses at 1st tick, the rest at second release
+            half = num_houses//2
+            add_event(0, np.arange(half))
+            add_event(second_release, np.arange(half, num_houses))
+        elif self.release_strat == "Low risk individuals":
+            add_event(0, self.house_dict["low risk houses"], np.flatnonzero(risk == LOW_RISK))
+            add_event(second_release, self.house_dict["high risk houses"], np.flatnonzero(risk == HIGH_RISK))
+        elif self.release_strat == "Low risk houses":
+            add_event(0, self.house_dict["low risk houses"])
+            add_event(second_release, self.house_dict["high risk houses"])
+        elif self.release_strat == "Everyone release":
+            add_event(0, np.arange(num_houses))
+
+        return events
+
+    def release(self):
+        '''
+        Releases the people and houses scheduled for the ticks of this step, if any
+        '''
+        for tick in range(self.tick, self.tick + self.substeps):
+            event = self.release_schedule.get(tick)
+            if event is not None:
+                self.release_event(*event)
+
+    def release_event(self, people, houses):
+        '''
+        Releases the given people and houses (arrays of ids) from quarantine
+        '''
+        if self.engine == "array":
+            self.array_engine.release(people)
+            return
+        for person in people:
+            self.people[person].at_home = False
+            if self.scheduler == "active":
+                self.schedule.wake(self.people[person])
+        for house in houses:
+            self.houses[house].people_home = False
+
+    def step_agents(self):
+        '''
+        Advances every person by one step of the engine
+        '''
+        if self.engine == "array" and self.time_step == "day":
+            self.array_engine.step_day()
+            self.schedule.steps += 1
+            self.schedule.time += 1
+        elif self.engine == "array":
+            self.array_engine.step()
+            # keep the scheduler's step count, BatchRunner stops on it
+            self.schedule.steps += 1
+            self.schedule.time += 1
+        else:
+            self.schedule.step()
+
     def step(self):
         '''
         Run one step of the model. If all agents are happy, halt the model.
         '''
-        self.infectious_count = 0  # Reset counters each step
-        #self.infectious_percent = 0
-        self.dead_count = 0
-        self.susceptible_count = 0
-        self.exposed_count = 0
-        self.schedule.step()
-        self.step_count += 1
-        # collect data
-        self.datacollector.collect(self)
+        if self.profiler is not None:
+            self.profiled_step()
+        else:
+            self.release()
+            self.step_agents()
+            self.step_count += self.substeps
+            self.tick += self.substeps
+            self.update_running()
+            # collect data
+            self.report()
 
+    def update_running(self):
+        '''
+        Stops the model once its end condition is reached
+        '''
         # run until no more agents are infectious
         # if self.infectious_count == 0 and self.exposed_count == 0:
         #     self.running = False
 
-        self.tick += 1
+        # or until max_days have been simulated
+        if self.max_days is not None and self.tick >= self.max_days*self.ticks_per_day:
+            self.running = False
+
+    def report(self):
+        '''
+        Records the counts in datacollector if the step reached a multiple of
+        report_ticks, and always on the step the model stops
+        '''
+        due = (self.report_ticks is not None and
+               self.step_count//self.report_ticks > (self.step_count - self.substeps)//self.report_ticks)
+        if due or not self.running:
+            self.datacollector.collect(self)
+
+    def profiled_step(self):
+        '''
+        step, recording the time of each phase in self.profiler
+        '''
+        profiler = self.profiler
+        begin = start = time.perf_counter()
+        self.release()
+        start = profiler.add("release", start)
+        self.step_agents()
+        self.step_count += self.substeps
+        self.tick += self.substeps
+        self.update_running()
+        start = time.perf_counter()
+        self.report()
+        profiler.add("collect", start)
+        profiler.add("step", begin)
 
 
 # code for batch runs
 
 # parameter lists for each parameter to be tested in batch run
 # BatchRunner runs every combination of parameters listed in br_params
-br_params = {"num_agents": [1000],
+# The four mobility/fraction symptomatic scenarios share one process pool and
+# one output file. The first parameter varies slowest, so listing the long
+# high-mobility runs first sends them to the workers before the short ones.
+br_params = {"mobility_speed": ["high", "low"],
+             "fraction_symptomatic": [0.1, 0.75],
+             "num_agents": [1000],
              "infectious_seed_pc": [0.01, 0.05],
              "recovered_seed_pc": [0.01, 0.1, 0.23],
              "high_risk_pc": [0.25],
-             "grid_area": ["Small", "Large"],
+             "grid_area": ["Small", "Large"], # or "WIDTHxHEIGHT", "density=AGENTS_PER_CELL"
              "house_init": ["Neighborhood"],
              "release_strat": ["Everyone release", "Random individual houses", "Low risk individuals", "Low risk houses"],
-             "mobility_speed": ["high"],
              "weeks_to_second_release": [2, 4]}
 
-br = BatchRunnerMP(Virus,
-                   nr_processes=4,
-                   variable_parameters=br_params,
-                   iterations=3, # number of times to run each parameter combination
-                   max_steps=2400, # number of steps for each model run
-                   model_reporters={"Data Collector": lambda m: m.datacollector})
+# every run simulates the same number of days, whatever its mobility
+# (600 ticks at low mobility, 2400 at high mobility)
+BATCH_DAYS = 120
+
+# rows of step data recorded per run: "day" = one per simulated day (Step is
+# still counted in ticks), an int k = every k ticks, "final" = only the state
+# after BATCH_DAYS days
+BATCH_REPORT_INTERVAL = "day"
+
+# record per-phase step times of every run, written to VirusModel_Phase_Times.csv
+PROFILE_BATCH = False
+
+# workers stream the step data of every run here (see StepDataWriter), the
+# files are merged into VirusModel_Step_Data.csv when the batch is done
+STEP_DATA_DIR = 'VirusModel_Step_Data_runs_{}'.format(int(time.time()))
+
+# "csv" writes VirusModel_Step_Data.csv, "parquet" (needs pyarrow) writes
+# VirusModel_Step_Data.parquet (steps) and VirusModel_Runs.parquet (parameters)
+OUTPUT_FORMAT = "csv"
+
+# mean, sd and se of every count per parameter combination and Step are
+# always written to VirusModel_Step_Summary.csv (see StepStatistics), the
+# series of every run only if RAW_STEP_DATA is True
+RAW_STEP_DATA = True
+
+br_reporters = {"Step Series": track_step_series,
+                "Phase Times": track_phase_times}
+if RAW_STEP_DATA:
+    br_reporters["Step Data"] = StepDataWriter(STEP_DATA_DIR, OUTPUT_FORMAT)
+
+br_statistics = StepStatistics()
+
+br = AggregatingBatchRunner(Virus,
+                            br_statistics,
+                            nr_processes=4,
+                            variable_parameters=br_params,
+                            iterations=3, # number of times to run each parameter combination
+                            # upper bound, runs stop after BATCH_DAYS days; it has to cover
+                            # BATCH_DAYS at high mobility (20 ticks per day) or the final
+                            # state of the longest runs is never reached
+                            max_steps=BATCH_DAYS*20,
+                            fixed_parameters={"max_days": BATCH_DAYS, "profile": PROFILE_BATCH,
+                                              "report_interval": BATCH_REPORT_INTERVAL},
+                            model_reporters=br_reporters)
+
+def output_path(name, extension):
+    '''
+    name.extension, or name_<time>.extension if that file already exists
+    '''
+    if os.path.exists('{}.{}'.format(name, extension)):
+        return '{}_{}.{}'.format(name, int(time.time()), extension)
+    return '{}.{}'.format(name, extension)
 
 if __name__ == '__main__':
     br.run_all()
     br_df = br.get_model_vars_dataframe()
-    br_step_data = pd.DataFrame()
-    for i in range(len(br_df["Data Collector"])):
-        if isinstance(br_df["Data Collector"][i], DataCollector):
-            i_run_data = br_df["Data Collector"][i].get_model_vars_dataframe()
-            br_step_data = br_step_data.append(i_run_data, ignore_index=True)
-
-    if os.path.exists('VirusModel_Step_Data.csv'):
-        br_step_data.to_csv('VirusModel_Step_Data_{}.csv'.format(int(time.time())))
-    else:
-        br_step_data.to_csv('VirusModel_Step_Data.csv')
-        #br_step_data.to_csv("/Users/shwu2259/GroupRotation/VirusModel_highmob_lowfrac.csv")
+    br_statistics.table().to_csv(output_path('VirusModel_Step_Summary', 'csv'), index=False)
+
+    if RAW_STEP_DATA:
+        manifests = list(br_df["Step Data"])
+        step_files = sorted(set(manifest["path"] for manifest in manifests))
+        if OUTPUT_FORMAT == "parquet":
+            rows = merge_parquet_step_files(manifests, output_path('VirusModel_Step_Data', 'parquet'),
+                                            output_path('VirusModel_Runs', 'parquet'))
+        else:
+            rows = merge_step_files(step_files, output_path('VirusModel_Step_Data', 'csv'))
+        if rows == sum(manifest["rows"] for manifest in manifests):
+            # every run made it into the merged file, the per-worker files can go
+            for path in step_files:
+                os.remove(path)
+            os.rmdir(STEP_DATA_DIR)
+
+    if PROFILE_BATCH:
+        # side table, one row per run and phase, labelled by the run itself
+        # (the parameter columns of br_df are not reliably in order)
+        phase_rows = []
+        for report in br_df["Phase Times"]:
+            if report is None:
+                continue
+            for phase, times in report["phases"].items():
+                phase_rows.append(dict(report["params"], Run=report["run"], Phase=phase,
+                                       Seconds=times["seconds"], Calls=times["calls"]))
+        phase_data = pd.DataFrame(phase_rows)
+        phase_data.to_csv(output_path('VirusModel_Phase_Times', 'csv'), index=False)
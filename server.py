@@ -134,9 +134,18 @@ chart = ChartModule([{"Label": "Susceptible", "Color": "#107AB0"},
                      {"Label": "Recovered", "Color": "#730039"}],
                      data_collector_name='datacollector')
 
+# grid_area of the GUI. The canvas is drawn once when the page loads, so this is
+# fixed for the session rather than a choice on the page: edit it and restart the
+# server to view another size. It must be a fixed size (a named area or
+# "WIDTHxHEIGHT"), as a density grid would change with the Number of Agents slider.
+GUI_GRID_AREA = "Demo"
+
+if GUI_GRID_AREA.startswith("density="):
+    raise ValueError("GUI_GRID_AREA must be a fixed size, not {}".format(GUI_GRID_AREA))
+
 model_params = {
-    "grid_area": UserSettableParameter("choice", "Grid Area", value="Demo", choices=["Demo", "Small", "Large"]),
-    "num_agents": UserSettableParameter("slider", "Number of Agents", 100, 1, 1000, 5),
+    "grid_area": GUI_GRID_AREA,
+    "num_agents": UserSettableParameter("slider", "Number of Agents", 100, 1, 5000, 5),
     "infectious_seed_pc": UserSettableParameter("slider", "Initial fraction infectious", ip, 0.00, 1.0, 0.01),
     "recovered_seed_pc": UserSettableParameter("slider", "Initial fraction recovered", 0.1, 0.00, 1.0, 0.01),
     "high_risk_pc": UserSettableParameter("slider", "Percentage high-risk agents", 0.25, 0.00, 1.0, 0.05),
@@ -148,17 +157,10 @@ model_params = {
     "weeks_to_second_release": UserSettableParameter("choice", "Weeks til second release", value = 4, choices = [2, 4, 6, 8])
     }
 
-if model_params["grid_area"].value == "Demo":
-    grid_height = md.GRID_HEIGHT_DEMO
-    grid_width = md.GRID_WIDTH_DEMO
-elif model_params["grid_area"].value == "Small":
-    grid_height = md.GRID_HEIGHT_SMALL
-    grid_width = md.GRID_WIDTH_SMALL
-elif model_params["grid_area"].value == "Large":
-    grid_height = md.GRID_HEIGHT_LARGE
-    grid_width = md.GRID_WIDTH_LARGE
-
-canvas_element = CanvasGrid(virus_draw, grid_height, grid_width, 500, 500)
+# canvas is sized from the grid_area every model of the session is built with
+grid_width, grid_height = md.grid_size(GUI_GRID_AREA, model_params["num_agents"].value)
+
+canvas_element = CanvasGrid(virus_draw, grid_width, grid_height, 500, 500)
 
 server = ModularServer(Virus,
                        [canvas_element, agent_count_element,